@@ -117,6 +117,51 @@ async function writeOutputDataBinary(name, data, compress) {
   outStream.end();
 }
 
+/**
+ * Writes a two-dimensional array of floating point numbers to a binary file in a sparse, row-wise (CSR) format.
+ * This is much smaller than the dense format of `writeOutputDataBinary` for the mostly-zero one-hot vectors. The
+ * file starts with three 32 bit little endian unsigned integer values, namely the number of entries, the number of
+ * values per entry and the number of non-zero values. After that, `indptr` (number of entries + 1 unsigned
+ * integers, the index of the first non-zero value of each entry), `indices` (one unsigned integer per non-zero
+ * value, its position in the entry) and `values` (one single-precision float per non-zero value) follow. The file
+ * will have the extension `.spdat` if it's uncompressed and `.spdat.gz` if it is compressed.
+ * @param {string} name - The basename of the output file, without extension.
+ * @param {object} data - The data to be written to the file, in a normal, two-dimensional array. All
+ * subarrays in this main array must have the same length.
+ * @param {boolean} [compress=false] - Indicates if the output file shall be compressed before writing
+ * it to the disk.
+ */
+async function writeOutputDataBinarySparse(name, data, compress) {
+  // collect the non-zero values of every entry
+  const indptr = new Uint32Array(data.length + 1);
+  const indices = [];
+  const values = [];
+  data.forEach((d, i) => {
+    d.forEach((x, j) => {
+      if (x !== 0) {
+        indices.push(j);
+        values.push(x);
+      }
+    });
+    indptr[i + 1] = indices.length;
+  });
+
+  // create header with both dimensions and the number of non-zero values, followed by the CSR arrays
+  const headerBuf = Buffer.from(new Uint32Array([data.length, data[0].length, indices.length]).buffer);
+  let finalBuf = Buffer.concat([
+    headerBuf,
+    Buffer.from(indptr.buffer),
+    Buffer.from(new Uint32Array(indices).buffer),
+    Buffer.from(new Float32Array(values).buffer),
+  ]);
+  if (compress) finalBuf = await zlibDeflate(finalBuf);
+
+  // write output data to file
+  let outStream = fs.createWriteStream(path.join(dirnameMain, `output/${name}.spdat${compress ? '.gz' : ''}`));
+  outStream.write(finalBuf);
+  outStream.end();
+}
+
 /**
  * Sanitizes a string by removing certain quirky characters in the input data, for example invalid
  * single quotes, wiki reference strings, or leading or training quotes.
@@ -329,9 +374,19 @@ class JoinedOneHotVector {
     return arr.map(c => this.createSingle(c));
   }
 
+  createSingleStatic(entry, attr) {
+    let ret = this.createSingle(entry);
+    ret.fill(0, this.offsets[attr], this.offsets[attr] + this.ranges[attr].span);
+    return ret;
+  }
+
+  createMultipleStatic(arr, attr) {
+    return arr.map(c => this.createSingleStatic(c, attr));
+  }
+
   createSingleUnfolded(entry, attr, labelFn, usedRange, rangeValModifier) {
     let retMain = this.createSingle(entry);
-    retMain[this.offsets[attr] + entry[attr]] = 0.0;
+    retMain[this.offsets[attr] + entry[attr] - this.ranges[attr].min] = 0.0; // set by createSingle
     if (usedRange === undefined) usedRange = this.ranges[attr];
     if (usedRange.span === undefined) usedRange.span = usedRange.max - usedRange.min + 1;
     if (rangeValModifier === undefined) rangeValModifier = (_, x) => x;
@@ -488,6 +543,7 @@ module.exports = {
   loadBayeseanPredictionsShow,
   writeOutputData,
   writeOutputDataBinary,
+  writeOutputDataBinarySparse,
   sanitizeString,
   sanitizedCmp,
   createSetFromAttrFunc,
@@ -13,7 +13,26 @@ const config = require('../common/config');
   ]);
 
   // create final data and labels, note that training data is shuffled to improve validation later
+  // (with --sparse, the mostly zero data is written in the much smaller sparse format)
   const johv = new utils.JoinedOneHotVector(charsTrain.concat(charsPredict), dataScalarAttrs, dataVectorAttrs);
+  const writeData = process.argv.includes('--sparse') ? utils.writeOutputDataBinarySparse : utils.writeOutputDataBinary;
+
+  // with --static, only one vector per character (without its age) is written, along with the ages every character
+  // has to be unfolded with; the predictor then creates the unfolded data (and training labels) on the fly
+  if (process.argv.includes('--static')) {
+    const ageRange = johv.ranges.age;
+    await writeData('v1-static-train', johv.createMultipleStatic(charsTrain, 'age'), true);
+    await writeData('v1-static-predict', johv.createMultipleStatic(charsPredict, 'age'), true);
+    await utils.writeOutputData('v1-unfolding', {
+      offset: johv.offsets.age,
+      min: ageRange.min,
+      max: ageRange.max,
+      train: charsTrain.map(c => ({ start: ageRange.min, count: ageRange.span, age: c.age })),
+      predict: charsPredict.map(c => ({ start: config.GOT_CURRENT_YEAR_SHOW - c.birth, count: config.PREDICTIONS_NUM_YEARS + 1 })),
+    });
+    return;
+  }
+
   let [dataTrain, labelsTrain] = utils.shuffleTwoArrays(
     johv.createMultipleUnfolded(charsTrain, 'age', (char, currAge) => [char.age >= currAge ? 1.0 : 0.0]),
   );
@@ -29,7 +48,7 @@ const config = require('../common/config');
   console.log(`number of dimensions per datapoint : ${dataTrain[0].length}`);
 
   // write data and labels to output file
-  await utils.writeOutputDataBinary('v1-data-train', dataTrain, true);
-  await utils.writeOutputDataBinary('v1-data-predict', dataPredict, true);
+  await writeData('v1-data-train', dataTrain, true);
+  await writeData('v1-data-predict', dataPredict, true);
   await utils.writeOutputDataBinary('v1-labels-train', labelsTrain, true);
 })();
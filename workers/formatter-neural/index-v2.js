@@ -12,8 +12,26 @@ const config = require('../common/config');
     utils.loadFormatterMLData('chars-to-predict'),
   ]);
 
-  // create final data and labels
+  // create final data and labels (with --sparse, the mostly zero data is written in the much smaller sparse format)
   const johv = new utils.JoinedOneHotVector(charsTrain.concat(charsPredict), dataScalarAttrs, dataVectorAttrs);
+  const writeData = process.argv.includes('--sparse') ? utils.writeOutputDataBinarySparse : utils.writeOutputDataBinary;
+
+  // with --static, only one vector per character (without its age) is written, along with the ages every character
+  // has to be unfolded with; the predictor then creates the unfolded data (and training labels) on the fly
+  if (process.argv.includes('--static')) {
+    const ageRange = johv.ranges.age;
+    await writeData('v2-static-train', johv.createMultipleStatic(charsTrain, 'age'), true);
+    await writeData('v2-static-predict', johv.createMultipleStatic(charsPredict, 'age'), true);
+    await utils.writeOutputData('v2-unfolding', {
+      offset: johv.offsets.age,
+      min: ageRange.min,
+      max: ageRange.max,
+      train: charsTrain.map(c => ({ start: ageRange.min, count: ageRange.span, age: c.age })),
+      predict: charsPredict.map(c => ({ start: config.GOT_CURRENT_YEAR_BOOK - c.birth, count: config.PREDICTIONS_NUM_YEARS + 1 })),
+    });
+    return;
+  }
+
   const [dataTrain, labelsTrain] = utils.shuffleTwoArrays(
     johv.createMultipleUnfolded(charsTrain, 'age', (char, currAge) => [char.age >= currAge ? 1.0 : 0.0]),
   );
@@ -25,7 +43,7 @@ const config = require('../common/config');
   );
 
   // write data and labels to output file
-  await utils.writeOutputDataBinary('v2-data-train', dataTrain, true);
-  await utils.writeOutputDataBinary('v2-data-predict', dataPredict, true);
+  await writeData('v2-data-train', dataTrain, true);
+  await writeData('v2-data-predict', dataPredict, true);
   await utils.writeOutputDataBinary('v2-labels-train', labelsTrain, true);
 })();
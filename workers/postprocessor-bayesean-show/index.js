@@ -11,6 +11,7 @@ function reformatOutput(predictionObject, callback) {
   let onlyAlive = {};
   onlyAlive.attributes = predictionObject.attributes;
   onlyAlive.meanBetaExp = predictionObject.meanBetaExp;
+  onlyAlive.survivalFunctionQuantileLevels = predictionObject.survivalFunctionQuantileLevels;
   onlyAlive.characters = {};
 
   for (let c of predictionObject.characters) {
@@ -18,11 +19,12 @@ function reformatOutput(predictionObject, callback) {
 
     let newChar = {};
     newChar.livedTo = c.livedTo;
-    // newChar.predictedSurvivalAge = c.predictedSurvivalAge;
-    // newChar.confIntervalLower = c.confIntervalLower;
-    // newChar.confIntervalHigher = c.confIntervalHigher;
-    // newChar.confIntervalConfidence = c.confIntervalConfidence;
+    newChar.predictedSurvivalAge = c.predictedSurvivalAge;
+    newChar.confIntervalLower = c.confIntervalLower;
+    newChar.confIntervalHigher = c.confIntervalHigher;
+    newChar.confIntervalConfidence = c.confIntervalConfidence;
     newChar.survivalFunctionMean = c.survivalFunctionMean;
+    newChar.survivalFunctionQuantiles = c.survivalFunctionQuantiles;
 
     onlyAlive.characters[c.name] = newChar;
   }
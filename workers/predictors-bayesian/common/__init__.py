@@ -0,0 +1 @@
+# predictors-bayesian
@@ -0,0 +1,37 @@
+import numpy as np
+
+
+
+# Death and exposure matrices of the piecewise constant hazard model, shared by the book and the show predictor.
+# Rows = characters, cols = intervals of interval_length (years resp. seasons); a character is exposed to the risk for
+# interval_length in every interval starting at or before its age, except for its last one (where it's only exposed
+# until its age), and its death (if any) is counted in that last interval.
+
+EXPOSURE_FLOOR = 1e-200 # too many zeroes in the exposure matrix cause problems with the sampler, so they're replaced
+
+def interval_bounds(duration, interval_length=1): # vector describing the boundaries of the intervals, given max duration
+  return np.arange(0, np.max(duration) + interval_length + 1, interval_length)
+
+def build_design(duration, is_dead, interval_length=1): # returns (death, exposure), exposure not floored yet
+  duration = np.asarray(duration, dtype=float)
+  bounds = interval_bounds(duration, interval_length)
+  characters = np.arange(duration.size)
+  last_period = np.floor((duration - 0.01) / interval_length).astype(int) # last period where a character was observed
+  death = np.zeros((duration.size, bounds.size - 1)) # cell = 1 if character died in this interval
+  death[characters, last_period] = is_dead
+  exposure = np.where(duration[:, np.newaxis] >= bounds[np.newaxis, :-1], float(interval_length), 0.0) # cell = time exposed to risk in this interval
+  exposure[characters, last_period] = duration - bounds[last_period]
+  return death, exposure
+
+def floor_exposure(exposure, floor=EXPOSURE_FLOOR): # assuming a tiny chance of dying after you're dead isn't so bad, is it?
+  exposure = np.asarray(exposure, dtype=float)
+  return np.where(exposure <= 0, floor, exposure)
+
+def at_risk_cells(death, exposure, floor=EXPOSURE_FLOOR):
+  # sparse version of death/exposure with only the cells where a character was actually exposed (or died), as
+  # (rows, cols, death, exposure) vectors. The Poisson terms of the other cells are exp(-floor * rate) ~ 1, i.e. they
+  # don't change the likelihood, so the model only has to evaluate these cells.
+  death = np.asarray(death, dtype=float)
+  exposure = np.asarray(exposure, dtype=float)
+  rows, cols = np.nonzero((exposure > floor) | (death > 0))
+  return rows, cols, death[rows, cols], np.maximum(exposure[rows, cols], floor)
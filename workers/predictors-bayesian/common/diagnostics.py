@@ -0,0 +1,51 @@
+import numpy as np
+
+
+
+# Convergence diagnostics for MCMC traces given as arrays of shape chains x draws x (parameter dimensions).
+# Both follow Gelman et al., Bayesian Data Analysis (3rd edition), using split chains.
+
+def split_chains(x): # halves every chain, so trends within a chain show up as disagreement between chains
+  x = np.asarray(x, dtype=float)
+  half = x.shape[1] // 2
+  return np.concatenate([x[:, :half], x[:, x.shape[1] - half:]], axis=0)
+
+def rhat(x): # potential scale reduction factor per parameter, close to 1.0 once the chains agree
+  x = split_chains(x)
+  n = x.shape[1]
+  within = x.var(axis=1, ddof=1).mean(axis=0)
+  between = n*x.mean(axis=1).var(axis=0, ddof=1)
+  var_plus = (n - 1)/n*within + between/n
+  return np.sqrt(var_plus/np.maximum(within, 1e-300))
+
+def autocovariance(x): # per chain and parameter, along the draws axis, computed via FFT
+  n = x.shape[1]
+  centered = x - x.mean(axis=1, keepdims=True)
+  size = 2**int(np.ceil(np.log2(2*n)))
+  f = np.fft.rfft(centered, n=size, axis=1)
+  return np.fft.irfft(f*np.conjugate(f), n=size, axis=1)[:, :n]/n
+
+def ess(x): # effective sample size per parameter, over all chains
+  x = split_chains(x)
+  m, n = x.shape[0], x.shape[1]
+  acov = autocovariance(x)
+  within = acov[:, 0].mean(axis=0)*n/(n - 1)
+  var_plus = within*(n - 1)/n + x.mean(axis=1).var(axis=0, ddof=1)
+  rho = 1.0 - (within - acov.mean(axis=0))/np.maximum(var_plus, 1e-300) # autocorrelation for every lag, combined over chains
+  rho[0] = 1.0
+  # Geyer's initial monotone sequence: sum pairs of autocorrelations while they are positive and non-increasing
+  num_pairs = n // 2
+  pairs = rho[:2*num_pairs].reshape((num_pairs, 2) + rho.shape[1:]).sum(axis=1)
+  positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+  pairs = np.minimum.accumulate(np.where(positive, pairs, 0.0), axis=0)
+  tau = -1.0 + 2.0*pairs.sum(axis=0)
+  return m*n/np.maximum(tau, 1.0/np.log10(max(m*n, 10)))
+
+def convergence_summary(chains, var_names): # chains maps variable names to chains x draws x ... arrays
+  summary = {}
+  for var in var_names:
+    r, e = rhat(chains[var]), ess(chains[var])
+    summary[var] = {"maxRhat": float(np.max(r)), "minEss": float(np.min(e))}
+  summary["maxRhat"] = max(summary[var]["maxRhat"] for var in var_names)
+  summary["minEss"] = min(summary[var]["minEss"] for var in var_names)
+  return summary
@@ -0,0 +1,17 @@
+import numpy as np
+
+
+
+# Characters sharing the same covariate vector also share the same hazard rate in every time slice, so their
+# Poisson terms can be merged: a sum of Poisson(exposure_i * rate) variables is Poisson(sum(exposure_i) * rate),
+# which leaves the likelihood of beta and lambda0 (and thus the posterior) unchanged up to a constant.
+
+def group_covariates(covariates, death, exposure): # returns (group covariates, summed death, summed exposure, group index of each character)
+  covariates = np.asarray(covariates, dtype=float)
+  unique, inverse = np.unique(covariates, axis=0, return_inverse=True)
+  inverse = inverse.reshape(-1)
+  order = np.argsort(inverse, kind="stable") # characters sorted by group, so every group is one contiguous block
+  starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+  grouped_death = np.add.reduceat(np.asarray(death, dtype=float)[order, :], starts, axis=0)
+  grouped_exposure = np.add.reduceat(np.asarray(exposure, dtype=float)[order, :], starts, axis=0)
+  return unique, grouped_death, grouped_exposure, inverse
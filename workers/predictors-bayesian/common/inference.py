@@ -0,0 +1,130 @@
+import time
+import numpy as np
+
+from tracecache import TRACE_VARS, load_trace_settings, load_trace_info, update_trace_info
+from diagnostics import convergence_summary
+
+
+
+# Inference back ends for the survival models. All of them return a dict mapping the names in TRACE_VARS to
+# arrays with one row per posterior sample, so the downstream survival code does not care how they were drawn.
+# PyMC3 is only imported once something is sampled, a run with a cached trace doesn't load it at all.
+
+INFERENCE_MODES = ["nuts", "advi", "fullrank_advi"]
+
+def trace_to_dict(trace):
+  return {var: np.asarray(trace[var]) for var in TRACE_VARS}
+
+def sample_nuts(model, n_samples, n_tune, num_chains, target_accept, seed, cores=None):
+  import pymc3 as pm
+  with model:
+    trace = pm.sample(n_samples, tune = n_tune, random_seed=seed, chains = num_chains, cores=cores, nuts_kwargs = dict(target_accept=target_accept))
+  diagnostics = convergence_summary({var: np.stack(trace.get_values(var, combine=False)) for var in TRACE_VARS}, TRACE_VARS)
+  diagnostics["divergences"] = int(np.sum(trace.get_sampler_stats('diverging')))
+  return trace_to_dict(trace), {"method": "nuts", "draws": n_samples*num_chains, "drawsPerChain": n_samples, "tune": n_tune, "chains": num_chains, "diagnostics": diagnostics}
+
+def sample_nuts_adaptive(model, increment, n_tune, num_chains, target_accept, seed, max_draws, rhat_max, ess_min, retune=200, cores=None):
+  # draws increment samples per chain at a time until R-hat and ESS of all TRACE_VARS meet the thresholds or max_draws is hit
+  # (the last increment is cut short to not draw more than max_draws per chain).
+  # Every increment continues from the last point of each chain, after a short re-tuning phase (retune steps, discarded).
+  # Passing the step of the first call on doesn't keep its adaptation: pm.sample resets the tuning of the step method
+  # and parallel chains adapt copies of it in their own processes, so the re-tuning is reported in the info instead
+  import pymc3 as pm
+  chains = {var: [] for var in TRACE_VARS} # per variable, list of chains x draws of the increment x ... arrays
+  increments = []
+  start = None
+  draws = 0
+  divergences = 0
+  while True:
+    size = min(increment, max_draws - draws)
+    with model:
+      trace = pm.sample(size, tune = n_tune if start is None else retune, random_seed=seed + len(increments), chains = num_chains, cores=cores, start=start, progressbar=False, nuts_kwargs = dict(target_accept=target_accept))
+    for var in TRACE_VARS:
+      chains[var].append(np.stack(trace.get_values(var, combine=False)))
+    draws += size
+    diagnostics = convergence_summary({var: np.concatenate(chains[var], axis=1) for var in TRACE_VARS}, TRACE_VARS)
+    diagnostics["drawsPerChain"] = draws
+    divergences += int(np.sum(trace.get_sampler_stats('diverging')))
+    diagnostics["divergences"] = divergences
+    increments.append(diagnostics)
+    if (diagnostics["maxRhat"] <= rhat_max and diagnostics["minEss"] >= ess_min) or draws >= max_draws:
+      break
+    free_vars = [v.name for v in model.free_RVs]
+    start = [{name: trace.point(-1, chain=c)[name] for name in free_vars} for c in trace.chains]
+  info = {
+    "method": "nuts",
+    "adaptive": True,
+    "draws": draws*num_chains,
+    "drawsPerChain": draws,
+    "tune": n_tune,
+    "retune": retune,
+    "discardedTuneStepsPerChain": n_tune + retune*(len(increments) - 1),
+    "chains": num_chains,
+    "converged": increments[-1]["maxRhat"] <= rhat_max and increments[-1]["minEss"] >= ess_min,
+    "thresholds": {"rhatMax": rhat_max, "essMin": ess_min, "maxDrawsPerChain": max_draws},
+    "diagnostics": increments[-1],
+    "increments": increments,
+  }
+  # same layout as a MultiTrace would have, i.e. all samples of the first chain, then those of the second one etc.
+  trace = {var: np.concatenate(chains[var], axis=1).reshape((-1,) + chains[var][0].shape[2:]) for var in TRACE_VARS}
+  return trace, info
+
+def fit_variational(model, method, n_draws, max_iterations, tolerance, seed): # method is "advi" or "fullrank_advi"
+  # stops as soon as the relative change of the variational parameters drops below tolerance (checked every 100 iterations)
+  import pymc3 as pm
+  convergence = pm.callbacks.CheckParametersConvergence(every=100, diff='relative', tolerance=tolerance)
+  with model:
+    approx = pm.fit(n=max_iterations, method=method, random_seed=seed, callbacks=[convergence], progressbar=False)
+  iterations = len(approx.hist)
+  info = {
+    "method": method,
+    "draws": n_draws,
+    "iterations": iterations,
+    "converged": iterations < max_iterations,
+    "finalLoss": float(np.mean(approx.hist[-100:])) if iterations > 0 else None, # mean negative ELBO over the last iterations
+  }
+  return trace_to_dict(approx.sample(n_draws)), info
+
+def run_inference(mode, model, n_samples, n_tune, num_chains, target_accept, seed, vi_max_iterations, vi_tolerance, adaptive=None, cores=None):
+  # adaptive is None for a fixed number of NUTS draws, or a dict with the increment, max_draws, rhat_max and ess_min settings
+  start = time.time()
+  if mode == "nuts" and adaptive is not None:
+    trace, info = sample_nuts_adaptive(model, adaptive["increment"], n_tune, num_chains, target_accept, seed, adaptive["max_draws"], adaptive["rhat_max"], adaptive["ess_min"], adaptive["retune"], cores)
+  elif mode == "nuts":
+    trace, info = sample_nuts(model, n_samples, n_tune, num_chains, target_accept, seed, cores)
+  elif mode in INFERENCE_MODES:
+    trace, info = fit_variational(model, mode, n_samples*num_chains, vi_max_iterations, vi_tolerance, seed)
+  else:
+    raise ValueError("unknown inference mode: " + mode)
+  info["seconds"] = time.time() - start
+  return trace, info
+
+def cached_trace_info(cache_dir, key, trace): # info stored along with a cached trace, incl. the NUTS convergence diagnostics
+  # entries stored without the diagnostics (e.g. before the info was stored) get them computed from the trace, whose
+  # samples are stored chain after chain, and stored along with it; divergences can't be recovered from the samples
+  info = load_trace_info(cache_dir, key)
+  settings = load_trace_settings(cache_dir, key)
+  if settings.get("inference") == "nuts" and "maxRhat" not in info.get("diagnostics", {}):
+    num_chains = info.get("chains", settings.get("num_chains"))
+    chains = {var: np.asarray(trace[var]).reshape((num_chains, -1) + np.shape(trace[var])[1:]) for var in TRACE_VARS}
+    diagnostics = dict(info.get("diagnostics", {}), **convergence_summary(chains, TRACE_VARS))
+    draws_per_chain = chains[TRACE_VARS[0]].shape[1]
+    info = dict(info, method="nuts", draws=draws_per_chain*num_chains, drawsPerChain=draws_per_chain, chains=num_chains, diagnostics=diagnostics)
+    update_trace_info(cache_dir, key, info)
+  return dict(info, cached=True, traceKey=key)
+
+def compare_traces(reference, candidate): # summary of how far an (approximate) trace is off from a reference trace
+  report = {}
+  for var in TRACE_VARS:
+    ref, cand = np.asarray(reference[var]), np.asarray(candidate[var])
+    ref_sd = ref.std(axis=0)
+    report[var] = {
+      "referenceMean": ref.mean(axis=0).tolist(),
+      "candidateMean": cand.mean(axis=0).tolist(),
+      "referenceSd": ref_sd.tolist(),
+      "candidateSd": cand.std(axis=0).tolist(),
+      "maxAbsMeanDiff": float(np.abs(ref.mean(axis=0) - cand.mean(axis=0)).max()),
+      "maxStandardizedMeanDiff": float((np.abs(ref.mean(axis=0) - cand.mean(axis=0)) / np.maximum(ref_sd, 1e-12)).max()), # in reference sds
+      "sdRatio": (cand.std(axis=0) / np.maximum(ref_sd, 1e-12)).tolist(),
+    }
+  return report
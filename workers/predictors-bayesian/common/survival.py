@@ -0,0 +1,121 @@
+import numpy as np
+
+
+
+# Batched computation of survival functions over the whole posterior trace.
+# With hazard[s, c, t] = baseHazard[s, t] * exp(beta[s] . x_c), the cumulative hazard factorizes into
+# exp(beta[s] . x_c) * cumsum_t(interval_length * baseHazard[s, :]), so the cumsum only has to be done once
+# per sample instead of once per sample and character.
+
+DEFAULT_CHUNK_SIZE = 32 # characters per chunk, peak memory is about samples * chunk_size * intervals * 8 bytes
+
+def cum_base_hazard(base_hazard, interval_length): # rows = samples, cols = cumulative base hazard up to and including a time slice
+  return (interval_length*np.asarray(base_hazard, dtype=float)).cumsum(axis=-1)
+
+def iter_survival_chunks(beta, base_hazard, params, interval_length, chunk_size=DEFAULT_CHUNK_SIZE):
+  # yields (start, stop, survival) with survival being a samples x characters x intervals tensor for the characters start...stop-1
+  beta = np.asarray(beta, dtype=float) # rows = samples, cols = coefficients
+  params = np.atleast_2d(np.asarray(params, dtype=float)) # rows = characters, cols = coefficients
+  cum_base = cum_base_hazard(base_hazard, interval_length)[:, np.newaxis, :]
+  num_characters = params.shape[0]
+  for start in range(0, num_characters, chunk_size):
+    stop = min(start + chunk_size, num_characters)
+    multipliers = np.exp(beta.dot(params[start:stop, :].transpose())) # samples x characters, one matmul for the whole chunk
+    survival = multipliers[:, :, np.newaxis]*cum_base
+    np.negative(survival, out=survival)
+    np.exp(survival, out=survival)
+    yield start, stop, survival
+
+def survival_function_means(beta, base_hazard, params, interval_length, chunk_size=DEFAULT_CHUNK_SIZE):
+  # rows = characters, cols = mean (over all samples) likelihood of surviving up to the end of a time slice
+  params = np.atleast_2d(params)
+  means = np.empty((params.shape[0], np.shape(base_hazard)[-1]))
+  for start, stop, survival in iter_survival_chunks(beta, base_hazard, params, interval_length, chunk_size):
+    survival.mean(axis=0, out=means[start:stop, :])
+  return means
+
+
+
+
+# Posterior summaries without keeping the survival functions of all samples: the trace is processed in blocks of
+# characters x time slices, with samples as the last (contiguous) axis, where sorting is much faster than np.quantile
+# along the first one. Exact quantiles need all samples of a cell at once, so everything that is held per block is
+# sized by the number of samples: the block itself (and its temporaries), the per-character multipliers and survival
+# ages and the cumulative base hazard of the block's time slices. Peak memory (besides the trace) stays within
+# max_bytes for any number of characters and time slices; only if not even a single cell fits, i.e. for traces of more
+# than max_bytes / BYTES_PER_SAMPLE samples, it's one character and time slice at a time, BYTES_PER_SAMPLE per sample.
+
+DEFAULT_MAX_BYTES = 64*1024*1024
+DEFAULT_LEVELS = [0.1, 0.5, 0.9] # quantiles of the survival function written per character
+DEFAULT_CONFIDENCE = 0.8 # credible interval of the survival age
+CELL_BYTES = 2*8 # per cell and sample: the float64 block and its temporaries (the >= 0.5 mask, the quantiles)
+CHARACTER_BYTES = 3*8 # per character and sample: the multipliers (and the matmul result) and the survival ages
+INTERVAL_BYTES = 8 # per time slice and sample: the cumulative base hazard of the block
+BYTES_PER_SAMPLE = CELL_BYTES + CHARACTER_BYTES + INTERVAL_BYTES + 8 # one cell, plus the running cumulative hazard
+
+def block_shape(num_characters, num_intervals, num_samples, max_bytes=DEFAULT_MAX_BYTES):
+  # (characters, time slices) per block, as many characters with all time slices as fit, else parts of the time slices
+  budget = max_bytes // num_samples - 8 # bytes per sample, minus the running cumulative hazard
+  chunk_size = (budget - INTERVAL_BYTES*num_intervals) // (CHARACTER_BYTES + CELL_BYTES*num_intervals)
+  if chunk_size >= 1:
+    return max(1, min(num_characters, chunk_size)), num_intervals
+  block_intervals = (budget - CHARACTER_BYTES) // (CELL_BYTES + INTERVAL_BYTES)
+  return 1, max(1, min(num_intervals, block_intervals))
+
+def iter_survival_blocks(beta, base_hazard, params, interval_length, max_bytes=DEFAULT_MAX_BYTES):
+  # yields (start, stop, t_start, t_stop, survival), survival being a characters x time slices x samples block; all
+  # blocks of a set of characters are yielded (in order of time) before moving on to the next characters
+  beta = np.asarray(beta, dtype=float)
+  params = np.atleast_2d(np.asarray(params, dtype=float))
+  base_hazard = np.asarray(base_hazard) # samples x time slices
+  num_samples, num_intervals = base_hazard.shape
+  num_characters = params.shape[0]
+  chunk_size, block_intervals = block_shape(num_characters, num_intervals, num_samples, max_bytes)
+  for start in range(0, num_characters, chunk_size):
+    stop = min(start + chunk_size, num_characters)
+    multipliers = np.exp(params[start:stop, :].dot(beta.transpose()))[:, np.newaxis, :] # characters x 1 x samples
+    cumulative = np.zeros(num_samples) # cumulative base hazard up to the current block
+    for t_start in range(0, num_intervals, block_intervals):
+      t_stop = min(t_start + block_intervals, num_intervals)
+      # same additions in the same order as cum_base_hazard, just one block of time slices (x samples) at a time
+      cum_base = interval_length*np.asarray(base_hazard[:, t_start:t_stop], dtype=float).transpose()
+      cum_base[0, :] += cumulative
+      np.cumsum(cum_base, axis=0, out=cum_base)
+      cumulative = cum_base[-1, :].copy()
+      survival = multipliers*cum_base[np.newaxis, :, :]
+      del cum_base
+      np.negative(survival, out=survival)
+      np.exp(survival, out=survival)
+      yield start, stop, t_start, t_stop, survival
+
+def sorted_quantiles(values, levels): # quantiles (linear interpolation, like np.quantile) along the last axis of sorted values
+  positions = np.asarray(levels, dtype=float)*(values.shape[-1] - 1)
+  lower = np.floor(positions).astype(int)
+  upper = np.minimum(lower + 1, values.shape[-1] - 1)
+  fraction = positions - lower
+  return np.stack([values[..., l]*(1.0 - f) + values[..., u]*f for l, u, f in zip(lower, upper, fraction)])
+
+def survival_summaries(beta, base_hazard, params, interval_length, levels=DEFAULT_LEVELS, confidence=DEFAULT_CONFIDENCE, max_bytes=DEFAULT_MAX_BYTES):
+  # dict with (rows = characters)
+  #   "mean": cols = mean likelihood of surviving up to the end of a time slice (same as survival_function_means)
+  #   "quantiles": levels x characters x time slices, posterior quantiles of that likelihood
+  #   "age": cols = median, lower and upper end of the central credible interval (confidence) of the survival age,
+  #     i.e. the time survived with a likelihood of at least 0.5 (capped at the end of the last time slice)
+  params = np.atleast_2d(params)
+  num_characters, num_intervals = params.shape[0], np.shape(base_hazard)[-1]
+  means = np.empty((num_characters, num_intervals))
+  quantiles = np.empty((len(levels), num_characters, num_intervals))
+  ages = np.empty((num_characters, 3))
+  age_levels = [0.5, (1.0 - confidence)/2, (1.0 + confidence)/2]
+  intervals_survived = None # characters (of the current chunk) x samples, number of time slices with a likelihood >= 0.5
+  for start, stop, t_start, t_stop, survival in iter_survival_blocks(beta, base_hazard, params, interval_length, max_bytes):
+    survival.mean(axis=2, out=means[start:stop, t_start:t_stop])
+    if t_start == 0:
+      intervals_survived = np.zeros((stop - start, survival.shape[2]), dtype=np.int64)
+    intervals_survived += np.count_nonzero(survival >= 0.5, axis=1)
+    survival.sort(axis=2)
+    quantiles[:, start:stop, t_start:t_stop] = sorted_quantiles(survival, levels)
+    if t_stop == num_intervals:
+      intervals_survived.sort(axis=1)
+      ages[start:stop, :] = sorted_quantiles(intervals_survived*float(interval_length), age_levels).transpose()
+  return {"mean": means, "quantiles": quantiles, "age": ages}
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from survival import cum_base_hazard, survival_function_means, survival_summaries, block_shape
+
+
+
+class SurvivalTest(unittest.TestCase):
+  def setUp(self):
+    rng = np.random.default_rng(0)
+    self.beta = rng.normal(0, 0.3, (301, 4)) # samples x coefficients
+    self.base_hazard = rng.gamma(1.0, 0.02, (301, 17)) # samples x time slices
+    self.params = (rng.random((9, 4)) < 0.4).astype(float) # characters x coefficients
+
+  def reference(self, levels, confidence): # survival functions of all samples at once, summarized with np.quantile
+    survival = np.exp(-np.exp(self.params.dot(self.beta.transpose()))[:, :, np.newaxis]*cum_base_hazard(self.base_hazard, 2.0)[np.newaxis, :, :])
+    ages = np.count_nonzero(survival >= 0.5, axis=2)*2.0
+    age_levels = [0.5, (1.0 - confidence)/2, (1.0 + confidence)/2]
+    return survival.mean(axis=1), np.quantile(survival, levels, axis=1), np.quantile(ages, age_levels, axis=1).transpose()
+
+  def test_like_np_quantile(self): # whole characters per block, parts of the time slices and a single cell per block
+    means, quantiles, ages = self.reference([0.1, 0.5, 0.9], 0.8)
+    for max_bytes in [64*1024*1024, 301*(24 + 16*17 + 8*17 + 8)*2, 301*100, 1]:
+      summaries = survival_summaries(self.beta, self.base_hazard, self.params, 2.0, [0.1, 0.5, 0.9], 0.8, max_bytes)
+      np.testing.assert_allclose(summaries["mean"], means, rtol=1e-12, atol=1e-15)
+      np.testing.assert_allclose(summaries["quantiles"], quantiles, rtol=1e-12, atol=1e-15)
+      np.testing.assert_allclose(summaries["age"], ages, rtol=1e-12)
+
+  def test_less_than_a_row(self): # max_bytes below one character with all time slices splits the time slices
+    self.assertEqual(block_shape(9, 17, 301, 301*100), (1, 2)) # (100 - 8 - 24) // (16 + 8) time slices
+    self.assertEqual(block_shape(0, 17, 301), (1, 17))
+    self.assertEqual(block_shape(9, 17, 301, 1), (1, 1))
+
+  def test_means_like_survival_function_means(self):
+    summaries = survival_summaries(self.beta, self.base_hazard, self.params, 2.0, max_bytes=301*200)
+    np.testing.assert_allclose(summaries["mean"], survival_function_means(self.beta, self.base_hazard, self.params, 2.0, chunk_size=4), rtol=1e-12)
+
+  def test_no_characters(self): # e.g. --incremental without changed characters
+    summaries = survival_summaries(self.beta, self.base_hazard, np.zeros((0, 4)), 2.0)
+    self.assertEqual(summaries["mean"].shape, (0, 17))
+    self.assertEqual(summaries["quantiles"].shape, (3, 0, 17))
+    self.assertEqual(summaries["age"].shape, (0, 3))
+    self.assertEqual(survival_function_means(self.beta, self.base_hazard, np.zeros((0, 4)), 2.0).shape, (0, 17))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
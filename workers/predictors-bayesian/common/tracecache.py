@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+
+
+# Persistent on-disk cache for posterior traces. Every entry is a directory named after the key, containing one
+# raw .npy file per trace variable (so it can be memory-mapped when loading) and a small meta.json. Entries are
+# evicted least-recently-used first once there are more than max_entries of them or they take more than max_bytes.
+
+TRACE_VARS = ["beta", "lambda0"]
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_BYTES = 512*1024*1024
+
+def trace_key(arrays, settings): # hash of the model inputs (e.g. covariates, death and exposure matrices) and of priors/sampler settings
+  h = hashlib.sha256()
+  for a in arrays:
+    a = np.ascontiguousarray(a)
+    h.update(str((a.dtype.str, a.shape)).encode("utf-8"))
+    h.update(a.tobytes())
+  h.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+  return h.hexdigest()[:32]
+
+def load_trace(cache_dir, key, mmap=True): # returns a dict of (memory-mapped) arrays, or None if the trace is not cached
+  entry = os.path.join(cache_dir, key)
+  if not os.path.isfile(os.path.join(entry, "meta.json")):
+    return None
+  with open(os.path.join(entry, "meta.json"), "r") as f:
+    meta = json.load(f)
+  trace = {}
+  for var in meta["vars"]:
+    trace[var] = np.load(os.path.join(entry, var + ".npy"), mmap_mode="r" if mmap else None)
+  os.utime(entry) # mark as recently used for the eviction
+  return trace
+
+def list_traces(cache_dir): # keys of all cached traces, most recently used first
+  if not os.path.isdir(cache_dir):
+    return []
+  entries = [e for e in os.listdir(cache_dir) if not e.startswith(".") and os.path.isfile(os.path.join(cache_dir, e, "meta.json"))]
+  return sorted(entries, key=lambda e: os.path.getmtime(os.path.join(cache_dir, e)), reverse=True)
+
+def load_trace_settings(cache_dir, key): # the settings (attributes, priors, sampler) a cached trace was obtained with
+  with open(os.path.join(cache_dir, key, "meta.json"), "r") as f:
+    return json.load(f).get("settings") or {}
+
+def load_trace_info(cache_dir, key): # the info (e.g. sampler diagnostics) stored along with a cached trace
+  with open(os.path.join(cache_dir, key, "meta.json"), "r") as f:
+    return json.load(f).get("info") or {}
+
+def update_trace_info(cache_dir, key, info): # replaces the info stored along with a cached trace
+  meta_file = os.path.join(cache_dir, key, "meta.json")
+  with open(meta_file, "r") as f:
+    meta = json.load(f)
+  meta["info"] = info
+  with open(meta_file + ".tmp", "w") as f:
+    json.dump(meta, f, indent=2, default=str)
+  os.replace(meta_file + ".tmp", meta_file)
+
+def store_trace(cache_dir, key, trace, settings=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, info=None):
+  os.makedirs(cache_dir, exist_ok=True)
+  tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir) # write everything first, then move it in place atomically
+  try:
+    for var in TRACE_VARS:
+      np.save(os.path.join(tmp, var + ".npy"), np.asarray(trace[var]))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+      json.dump({"vars": TRACE_VARS, "settings": settings, "info": info}, f, indent=2, default=str)
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+      shutil.rmtree(entry)
+    os.rename(tmp, entry)
+  except BaseException:
+    shutil.rmtree(tmp, ignore_errors=True)
+    raise
+  evict(cache_dir, max_entries, max_bytes, keep=key)
+
+def entry_size(entry):
+  return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+def evict(cache_dir, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, keep=None): # drop least recently used entries
+  entries = [os.path.join(cache_dir, e) for e in os.listdir(cache_dir) if not e.startswith(".")]
+  entries = sorted(filter(os.path.isdir, entries), key=os.path.getmtime, reverse=True)
+  total = 0
+  for i, entry in enumerate(entries):
+    size = entry_size(entry)
+    if os.path.basename(entry) != keep and (i >= max_entries or total + size > max_bytes):
+      shutil.rmtree(entry, ignore_errors=True)
+    else:
+      total += size
@@ -1,68 +1,161 @@
-from matplotlib import pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import pymc3 as pm
-from pymc3.distributions.timeseries import GaussianRandomWalk
-from theano import tensor as T
 import random
+import argparse
 import json
-import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../common"))
+from survival import survival_function_means, survival_summaries
+from tracecache import trace_key, load_trace, load_trace_settings, store_trace
+from grouping import group_covariates
+from design import interval_bounds, build_design, floor_exposure, at_risk_cells
+from inference import INFERENCE_MODES, run_inference, cached_trace_info, compare_traces
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../predictors-common"))
+from instrumentation import fromEnvironment
+from incremental import arraysHash, loadState, saveState, changedItems, mergeByName
+from columnar import writeColumnar
 
 infile = "../../formatter-bayesean-show/training_show_characters.json"
 outfile = "./show_predictor_output.json"
+reportfile = "./show_inference_report.json"
+columnarfile = "./show_predictions.npz" # compact output of the alive characters, see --output-format
+statefile = "./show_predictor_state.json" # trace and content hashes of the characters the output was computed with, for --incremental
+runreportfile = "./show_run_report.json" # per-stage timings and memory, only written if PREDICTORS_REPORT is set
+
+instrumentation = fromEnvironment()
+
+SEED = random.randint(1,10000000) # will be used in the sampler
+priors = dict(lambda0_mu=0.15, lambda0_sd=0.1, beta_mu=0, beta_sd=1000)
+# create the model
+def build_model(covariates, exposure, death): # exposure not floored yet
+  import pymc3 as pm # only loaded if there's no cached trace
+  from theano import tensor as T
+  with pm.Model() as model:
+    lambda0 = pm.Gamma('lambda0', mu=priors['lambda0_mu'], sd=priors['lambda0_sd'], shape=1) # this is a scalar (base chance to die per episode)
+    beta = pm.Normal('beta', mu=priors['beta_mu'], sd=priors['beta_sd'], shape=num_parameters) # this is a vector (one coefficient per covariate)
+    if sparse_design: # only the cells where a character was at risk, see at_risk_cells
+      rows, cols, cell_death, cell_exposure = at_risk_cells(death, exposure)
+      lambda_ = T.exp(T.dot(covariates, beta))[rows]*lambda0 # this is a vector (risk of the character of a cell in its time slice)
+      mu = cell_exposure*lambda_ # this is also a vector (same as lambda_, times the time the character was exposed in the cell)
+      obs = pm.Poisson('obs', mu, observed=cell_death)
+    else:
+      lambda_ = pm.Deterministic('lambda_', T.outer(T.exp(T.dot(covariates, beta)), lambda0)) # this is a matrix (risk of character(row) in a time slice(col))
+      mu = pm.Deterministic('mu', floor_exposure(exposure)*lambda_) # this is also a matrix (risk = 0 if character already dead, otherwise same as lambda_)
+      obs = pm.Poisson('obs', mu, observed=death)
+  return model
+  
+n_samples = 1000 # both should be 1000, 100 for quick testing
+n_tune = 1000
+acceptance_probability = 0.9
+num_chains = 2
+chunk_size = 32 # characters per batch when computing the survival functions, bounds peak memory
+survival_max_bytes = 64*1024*1024 # bound of the memory used for the posterior quantiles (at least BYTES_PER_SAMPLE per sample)
+quantile_levels = [0.1, 0.5, 0.9] # posterior quantiles of the survival function written per character
+confidence = 0.8 # of the credible interval of the survival age
+columnar_quantize = False # store the survival functions in the columnar output as uint16 instead of float64
+columnar_meta = ["attributes", "meanBetaExp", "survivalFunctionQuantileLevels"] # what the postprocessor keeps of the output
+columnar_fields = ["livedTo", "predictedSurvivalAge", "confIntervalLower", "confIntervalHigher", "confIntervalConfidence", "survivalFunctionMean", "survivalFunctionQuantiles"]
+use_trace_cache = True # reuse the trace of an earlier run if the inputs, priors and sampler settings did not change
+trace_cache_dir = "./trace-cache"
+trace_cache_max_entries = 8 # least recently used traces are evicted beyond this
+group_identical_covariates = True # fit the model on one row per distinct covariate vector, gives the same posterior
+sparse_design = True # only evaluate the likelihood where characters were at risk instead of the whole death/exposure matrices
+vi_max_iterations = 50000 # upper bound of optimization steps for the variational inference modes
+vi_tolerance = 1e-3 # relative change of the variational parameters at which the fit is considered converged
+adaptive_increment = 250 # with --adaptive, draws per chain between two convergence checks
+adaptive_max_draws = 4000 # with --adaptive, hard cap of draws per chain
+adaptive_retune = 200 # with --adaptive, tuning steps (discarded) before every increment but the first one
+rhat_max = 1.01 # with --adaptive, sampling stops once R-hat of beta and lambda0 is at most this...
+ess_min = 400 # ...and their effective sample size is at least this
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--inference", choices=INFERENCE_MODES, default="nuts", help="NUTS sampling (default) or a faster variational approximation of the posterior")
+parser.add_argument("--compare-with-nuts", action="store_true", help="also get a NUTS reference trace and write a report comparing both to " + reportfile)
+parser.add_argument("--chains", type=int, default=num_chains, help="number of NUTS chains (default: %(default)s)")
+parser.add_argument("--cores", type=int, default=None, help="number of chains sampled in parallel, i.e. CPU cores used by the sampler")
+parser.add_argument("--adaptive", action="store_true", help="draw NUTS samples in increments until the convergence thresholds below are met")
+parser.add_argument("--rhat-max", type=float, default=rhat_max, help="largest acceptable R-hat of beta and lambda0 (default: %(default)s)")
+parser.add_argument("--ess-min", type=float, default=ess_min, help="smallest acceptable effective sample size of beta and lambda0 (default: %(default)s)")
+parser.add_argument("--max-draws", type=int, default=adaptive_max_draws, help="hard cap of draws per chain (default: %(default)s)")
+parser.add_argument("--retune", type=int, default=adaptive_retune, help="tuning steps per chain before every increment after the first one, PyMC3 can't carry the tuned step size and mass matrix over (default: %(default)s)")
+parser.add_argument("--cached-only", action="store_true", help="only use a cached trace, exit with an error instead of sampling if there is none")
+parser.add_argument("--incremental", action="store_true", help="keep the trace of the last run (if still cached) and only compute the survival functions of new or changed characters")
+parser.add_argument("--output-format", choices=["json", "columnar", "both"], default="json", help="write the full JSON output (default), the compact columnar output of the alive characters (" + columnarfile + ", columnar.py exports it to the postprocessed JSON) or both")
+args = parser.parse_args()
+if args.adaptive and args.max_draws < 4:
+  parser.error("--max-draws has to be at least 4, R-hat and ESS are computed from the halves of every chain")
+if args.compare_with_nuts and args.inference == "nuts":
+  parser.error("--compare-with-nuts compares an approximation with NUTS, use it with --inference advi or fullrank_advi")
+num_chains = args.chains
+adaptive = dict(increment=adaptive_increment, max_draws=args.max_draws, rhat_max=args.rhat_max, ess_min=args.ess_min, retune=args.retune) if args.adaptive else None
 
 # read input file
-df = pd.read_json(path_or_buf = infile, typ = "frame")
+with instrumentation.stage("readInput"):
+  df = pd.read_json(path_or_buf = infile, typ = "frame")
 
 df.livedTo += 1; # this is because having died in the n-th season still means you endured the risk of the n-th season
 
-# get some parameters
-num_characters = df.shape[0]
-characters = np.arange(num_characters) # vector 1....num_characters
+with instrumentation.stage("designMatrices"):
+  # get some parameters
+  num_characters = df.shape[0]
 
-# set parameters
-interval_length = 1 # discretization over interval_length-year intervals
-interval_bounds = np.arange (0, df.livedTo.max() + interval_length + 1, interval_length) # vector describing the boundaries of the intervals
-n_intervals = interval_bounds.size - 1 # number of intervals, given max livedTo
-intervals = np.arange(n_intervals) # indexes of intervals in a vector
+  # set parameters
+  interval_length = 1 # discretization over interval_length-season intervals
+  n_intervals = interval_bounds(df.livedTo, interval_length).size - 1 # number of intervals, given max livedTo
 
-# determine death matrix and exposure matrix
-last_period = np.floor((df.livedTo - 0.01) / interval_length).astype(int) # last period where a character was observed
-  
-death = np.zeros((num_characters, n_intervals)) # matrix rows = chars, cols = intervals, cell = 1 if character died in this interval
-death[characters, last_period]=df.isDead
+  # determine death matrix and exposure matrix (rows = chars, cols = intervals), see common/design.py
+  death, raw_exposure = build_design(df.livedTo.values, df.isDead.values, interval_length)
+  exposure = floor_exposure(raw_exposure) # dense exposure as the model saw it, no zeroes
 
-exposure = np.greater_equal.outer(df.livedTo, interval_bounds[:-1])*interval_length # matrix rows=chars, cols=intervals, cell = number of years character was exposed to risk in this interval
-exposure[characters, last_period] = df.livedTo - interval_bounds[last_period]
-exposure=exposure.astype(np.float) # keep it as a float for calculation purposes
+  # convert the DataFrame into a numPy array (also exclude columns we don't want to have as training parameters)
+  df_dropped = df.drop(["livedTo", "isDead", "name"], axis=1)
+  colNames = df_dropped.columns.values.tolist() # will use later when writing the prediction file
+  df_num=df_dropped.to_numpy().astype(float) # characters=rows, attributes=cols
+  num_parameters = df_num.shape[1];
 
-# too many zeroes in the exposure matrix apparently cause a lot of problems, so just replace them with sth very small
-filter_func = np.vectorize(lambda v: 1e-200 if v<=0 else v) # assuming a tiny chance of dying after you're dead isn't so bad, is it?
-exposure = filter_func(exposure)
+def get_trace(mode): # sample the model (or load the trace from the cache)
+  settings = dict(attributes=colNames, priors=priors, inference=mode, n_samples=n_samples, num_chains=num_chains)
+  if mode == "nuts":
+    settings.update(n_tune=n_tune, target_accept=acceptance_probability, adaptive=adaptive)
+  else:
+    settings.update(vi_max_iterations=vi_max_iterations, vi_tolerance=vi_tolerance)
+  key = trace_key([df_num, death, exposure], settings)
+  trace = load_trace(trace_cache_dir, key) if use_trace_cache else None
+  if trace is not None:
+    return trace, cached_trace_info(trace_cache_dir, key, trace)
+  if args.cached_only:
+    sys.exit("no cached " + mode + " trace for these inputs and settings, run without --cached-only first")
+  if group_identical_covariates: # characters with identical covariates share a rate, so sum their deaths and exposures
+    group_num, group_death, group_exposure, _ = group_covariates(df_num, death, raw_exposure)
+    model = build_model(group_num, group_exposure, group_death)
+  else:
+    model = build_model(df_num, raw_exposure, death)
+  trace, info = run_inference(mode, model, n_samples, n_tune, num_chains, acceptance_probability, SEED, vi_max_iterations, vi_tolerance, adaptive if mode == "nuts" else None, args.cores)
+  if use_trace_cache:
+    store_trace(trace_cache_dir, key, trace, settings, max_entries=trace_cache_max_entries, info=info)
+  info["cached"] = False
+  info["traceKey"] = key
+  return trace, info
 
-# convert the DataFrame into a numPy array (also exclude columns we don't want to have as training parameters)
-df_dropped = df.drop(["livedTo", "isDead", "name"], axis=1)
-colNames = df_dropped.columns.values.tolist() # will use later when writing the prediction file
-df_num=df_dropped.to_numpy().astype(float) # characters=rows, attributes=cols
-num_parameters = df_num.shape[1];
+def get_previous_trace(state): # the trace of the last run, if it's still cached and was obtained the same way and with the same attributes
+  if state is None or not use_trace_cache:
+    return None, None
+  trace = load_trace(trace_cache_dir, state["model"])
+  if trace is None:
+    return None, None
+  settings = load_trace_settings(trace_cache_dir, state["model"])
+  if settings.get("attributes") != colNames or settings.get("inference") != args.inference:
+    return None, None
+  return trace, cached_trace_info(trace_cache_dir, state["model"], trace)
 
-SEED = random.randint(1,10000000) # will be used in the sampler
-# create the model
-with pm.Model() as model:
-  lambda0 = pm.Gamma('lambda0', mu=0.15, sd=0.1, shape=1) # this is a scalar (base chance to die per episode)
-  beta = pm.Normal('beta', mu=0, sd=1000, shape=num_parameters) # this is a vector (one coefficient per covariate)
-  lambda_ = pm.Deterministic('lambda_', T.outer(T.exp(T.dot(df_num, beta)), lambda0)) # this is a matrix (risk of character(row) in a time slice(col))
-  mu = pm.Deterministic('mu', exposure*lambda_) # this is also a matrix (risk = 0 if character already dead, otherwise same as lambda_)
-  obs = pm.Poisson('obs', mu, observed=death) 
-  
-n_samples = 1000 # both should be 1000, 100 for quick testing
-n_tune = 1000
-acceptance_probability = 0.9
-num_chains = 2
-# now, sample the model
-with model:
-  trace = pm.sample(n_samples, tune = n_tune, random_seed=SEED, chains = num_chains, nuts_kwargs = dict(target_accept=acceptance_probability))
+with instrumentation.stage("inference"):
+  state = loadState(statefile) if args.incremental else None
+  trace, inference_info = get_previous_trace(state) # with --incremental, the trace is only replaced if it's not available anymore
+  if trace is None:
+    trace, inference_info = get_trace(args.inference)
+instrumentation.recordSampler(inference_info)
   
 # print(trace['beta'].mean(axis = 0))
 # print(trace['lambda0'])
@@ -71,57 +164,69 @@ beta = trace['beta'] # rows = samples, columns = coefficients
 lambda0 = trace['lambda0'] # rows = samples, single column = base risk per episode
 
 num_slices = 50 # since lambda0 is the same for all slices, this indicates how far into the future the model must look
+def get_base_hazard(trace): # rows = samples, cols = base risk to die in a time slice
+  return trace['lambda0'] * np.ones(num_slices)
 
-def get_dotprodfactors(params): # get the hazard multipliers (not yet exponentiated) for each sample of the trace, depending on the parameters
-  return trace['beta'].dot(np.atleast_2d(params).transpose()) # mutliple dot products => matrix multiplication
-
-def calc_hazard(dotprodfactors): # calculates hazard values for each time slice up to, but not including, time, dependent on the params
-  return (trace['lambda0'] * np.ones(num_slices)) * np.exp(dotprodfactors)
-  
-def cum_hazard(hazard): # given hazard-per-timeslice values, calculate cumulative hazard
-  return (interval_length*hazard).cumsum(axis=-1)
-  
-def survival(hazard): # describes likelihood of surviving the cumulative hazard
-  return np.exp(-cum_hazard(hazard))
-  
-def survivalParams(params): # describes survival function distribution (i.e. a set of samples, each being a survival function), given some params
-  return survival(calc_hazard(get_dotprodfactors(params)))
-  
-def fitAge_greater_equal(survFn, greaterThan): # how many years are equally or more probable than greaterThan?
-  fits = np.greater_equal(survFn, greaterThan).astype(int).sum(axis=1)*interval_length
-  return fits
-  
-def fitAge_greater_equal_mean(survFn, greaterThan):
-  return fitAge_greater_equal(survFn, greaterThan).mean()
-  
-def fitAge_greater_equal_last(survFn, greaterThan):
-  return fitAge_greater_equal(survFn, greaterThan)[-1]
-  
 # Now construct the output file
-predictions = {} # we'll write this dict to a JSON
-# predictions["priorHazard"] = trace['lambda0'].astype(float).tolist()
-predictions["attributes"] = colNames
-beta = trace['beta'] #  make a mean of all rows in the entire trace, transform the column matrix into a (single-) row matrix and get the row out
-# predictions["betaExp"] = np.exp(beta).astype(float).tolist()
-predictions["meanBetaExp"] = np.exp(beta.mean(axis=0)).astype(float).tolist()
-predictions["characters"] = []
-# now add the survial function for every character
-for i in range(0, num_characters):
-  ch = {} # this dict will represent the character's survival function
-  ch["name"] = df["name"][i]
-  ch["alive"] = False if df["isDead"][i] > 0 else True
-  ch["livedTo"] = df["livedTo"].astype(float)[i]
-  survFn= survivalParams(df_num[i, :]).astype(float) # take the i-th row of df_num for the character's parameters
-  fitAge50 = fitAge_greater_equal(survFn, 0.5).astype(float)
-  # ch["predictedSurvivalAge"] = fitAge50.tolist()
-  # ch["likelihoodSeason8"] = (np.sum(np.greater_equal(fitAge50, 8).astype(float)))/(n_samples*num_chains)
-  confidence = 0.8
-  # ch["confIntervalLower"] = fitAge_greater_equal(survFn, confidence).astype(float).tolist()
-  # ch["confIntervalHigher"] = fitAge_greater_equal(survFn, 1-confidence).astype(float).tolist()
-  # ch["confIntervalConfidence"] = confidence
-  ch["survivalFunctionMean"] = survFn.mean(axis=0).tolist()
-  predictions["characters"].append(ch)
+with instrumentation.stage("survival"):
+  predictions = {} # we'll write this dict to a JSON
+  # predictions["priorHazard"] = trace['lambda0'].astype(float).tolist()
+  predictions["attributes"] = colNames
+  predictions["inference"] = inference_info # how the trace was obtained, incl. draw counts and convergence diagnostics
+  beta = trace['beta'] #  make a mean of all rows in the entire trace, transform the column matrix into a (single-) row matrix and get the row out
+  # predictions["betaExp"] = np.exp(beta).astype(float).tolist()
+  predictions["meanBetaExp"] = np.exp(beta.mean(axis=0)).astype(float).tolist()
+  # with --incremental and the same trace, only characters whose covariates, death or exposure changed are computed again
+  names = df["name"].tolist()
+  summary_settings = json.dumps([quantile_levels, confidence]) # part of the hashes, changing them changes every character's output
+  hashes = [arraysHash([df_num[i], death[i], exposure[i], summary_settings]) for i in range(num_characters)]
+  previous = {}
+  if state is not None and os.path.isfile(outfile):
+    with open(outfile, 'r') as f:
+      previous = {ch["name"]: ch for ch in json.load(f)["characters"]}
+  recompute = changedItems(state, inference_info["traceKey"], names, hashes, previous)
+  instrumentation.record("computedCharacters", int(recompute.size))
+  # compute the survival functions of these characters at once, summarized to their mean, quantiles and the survival age
+  summaries = survival_summaries(trace['beta'], get_base_hazard(trace), df_num[recompute], interval_length, quantile_levels, confidence, survival_max_bytes)
+  survFnMeans = summaries["mean"]
+  predictions["survivalFunctionQuantileLevels"] = quantile_levels
+  # now add the survial function for every character
+  recomputed = {}
+  for j, i in enumerate(recompute):
+    ch = {} # this dict will represent the character's survival function
+    ch["name"] = df["name"][i]
+    ch["alive"] = False if df["isDead"][i] > 0 else True
+    ch["livedTo"] = df["livedTo"].astype(float)[i]
+    ch["predictedSurvivalAge"] = float(summaries["age"][j, 0]) # median (over the posterior) of the time survived with a likelihood >= 0.5
+    ch["confIntervalLower"] = float(summaries["age"][j, 1])
+    ch["confIntervalHigher"] = float(summaries["age"][j, 2])
+    ch["confIntervalConfidence"] = confidence
+    ch["survivalFunctionMean"] = survFnMeans[j, :].tolist()
+    ch["survivalFunctionQuantiles"] = summaries["quantiles"][:, j, :].tolist() # one list per level in quantile_levels
+    recomputed[names[i]] = ch
+  predictions["characters"] = list(mergeByName(names, recomputed, previous).values())
   
 # now write the predictions object to a file
-output = open(outfile, 'w')
-json.dump(predictions, output, indent=2)
+with instrumentation.stage("writeOutput"):
+  if args.output_format in ["json", "both"]:
+    with open(outfile, 'w') as output:
+      json.dump(predictions, output, indent=2)
+    saveState(statefile, inference_info["traceKey"], names, hashes) # --incremental merges into the JSON output
+  if args.output_format in ["columnar", "both"]:
+    chars = predictions["characters"]
+    columns = {field: [ch[field] for ch in chars] for field in columnar_fields}
+    writeColumnar(columnarfile, [ch["name"] for ch in chars], columns, {key: predictions[key] for key in columnar_meta}, columnar_quantize, keep=[ch["alive"] for ch in chars])
+
+# optionally, compare the posterior with a NUTS reference run
+if args.compare_with_nuts:
+  with instrumentation.stage("comparison"):
+    reference, reference_info = get_trace("nuts")
+    report = {"candidate": inference_info, "reference": reference_info, "parameters": compare_traces(reference, trace)}
+    referenceSurvFnMeans = survival_function_means(reference['beta'], get_base_hazard(reference), df_num, interval_length, chunk_size)
+    if recompute.size < num_characters: # only some characters were computed incrementally
+      survFnMeans = survival_function_means(trace['beta'], get_base_hazard(trace), df_num, interval_length, chunk_size)
+    report["survivalFunctionMeanMaxAbsDiff"] = float(np.abs(referenceSurvFnMeans - survFnMeans).max())
+    with open(reportfile, 'w') as f:
+      json.dump(report, f, indent=2)
+
+instrumentation.write(runreportfile)
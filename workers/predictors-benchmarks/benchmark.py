@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import datetime
+import subprocess
+import tracemalloc
+import numpy as np
+import scipy.sparse
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+workersDir = os.path.join(dirname, "..")
+sys.path.insert(0, os.path.join(dirname, "../predictors-neural/common"))
+sys.path.insert(0, os.path.join(dirname, "../predictors-bayesian/common"))
+
+
+
+# Benchmarks of the predictor hot paths on synthetic data in the formats of the real one, at multiples of the current
+# scale (484 characters). Every (stage, scale) case runs in its own process, so its peak memory can be measured
+# separately and it can be stopped after a timeout. Wall time, CPU time and peak RSS are measured without tracemalloc,
+# the peak of the Python allocations is traced in a second process running the case again. Results are appended to output/benchmark-results.json.
+
+NUM_CHARACTERS = 484
+NUM_TRAIN_ROWS = 18800 # unfolded neural training data, i.e. dead characters x ages
+NUM_PREDICTION_YEARS = 21
+NUM_INTERVALS = 100 # age intervals of the Bayesian book model
+NUM_COVARIATES = 13
+NUM_TRACE_SAMPLES = 2000 # 2 chains x 1000 draws
+SURVIVAL_MAX_BYTES = 64*1024*1024 # survival_max_bytes of the Bayesian predictors
+# layout of a formatter-neural v2 row: scalar values, then (name, size, number of hot values) per block
+NUM_SCALARS = 3
+BLOCKS = [("age", 100, 1), ("allegiances", 396, 2), ("books", 19, 3), ("culture", 57, 1), ("house", 360, 1), ("houseRegion", 29, 1), ("locations", 82, 3), ("titles", 515, 1)]
+NUM_DIMS = NUM_SCALARS + sum(size for _, size, _ in BLOCKS)
+V2_LAYERS = [500, 250, 100, 1]
+
+def syntheticOneHotRows(n, rng): # CSR matrix with n rows looking like formatter-neural v2 data
+  cols = [np.tile(np.arange(NUM_SCALARS), (n, 1))]
+  vals = [np.column_stack([rng.integers(0, 2, n), rng.random(n), rng.random(n)])]
+  offset = NUM_SCALARS
+  for _, size, hot in BLOCKS:
+    cols.append(offset + rng.integers(0, size, (n, hot)))
+    vals.append(np.ones((n, hot)))
+    offset += size
+  cols, vals = np.hstack(cols), np.hstack(vals)
+  indptr = np.arange(n + 1)*cols.shape[1]
+  m = scipy.sparse.csr_matrix((vals.reshape(-1).astype(np.float32), cols.reshape(-1), indptr), shape=(n, NUM_DIMS))
+  m.sum_duplicates()
+  return m
+
+def writeFormattedBinaryGz(filename, rows, rng, chunkRows=4096): # same format as writeOutputDataBinary in workers/common/utils.js
+  compressor = zlib.compressobj()
+  with open(filename, "wb") as f:
+    f.write(compressor.compress(struct.pack("<ii", rows, NUM_DIMS)))
+    for i in range(0, rows, chunkRows):
+      f.write(compressor.compress(syntheticOneHotRows(min(chunkRows, rows - i), rng).toarray().tobytes()))
+    f.write(compressor.flush())
+
+def syntheticCharacterTable(n, rng): # like formatter-bayesean-book's output: age, isDead and 0/1 covariates
+  import pandas as pd
+  df = pd.DataFrame({"name": ["Character %d" % i for i in range(n)], "isDead": rng.integers(0, 2, n), "age": rng.integers(1, NUM_INTERVALS, n)})
+  for j in range(NUM_COVARIATES):
+    df["attr%d" % j] = (rng.random(n) < 0.2).astype(int)
+  return df
+
+def buildDesign(df, interval_length=1): # death and exposure matrices, as built by the Bayesian predictors
+  from design import build_design, floor_exposure
+  death, exposure = build_design(df.age.values, df.isDead.values, interval_length)
+  return death, floor_exposure(exposure)
+
+
+
+# every stage has a setup (not measured) returning the arguments of its run function and an estimate of the bytes
+# it needs in memory/on disk, which is used to skip cases that would not fit
+
+def writeReadData(scale, workDir, rng): # formatter output in workDir/output, returns the worker name to read it with
+  os.makedirs(os.path.join(workDir, "output"), exist_ok=True)
+  writeFormattedBinaryGz(os.path.join(workDir, "output", "data.dat.gz"), NUM_TRAIN_ROWS*scale, rng)
+  return os.path.relpath(workDir, workersDir)
+
+def setupReadCold(scale, workDir, rng): # first read: decompression into the sidecar
+  from utils import readFormattedBinaryMLFile
+  worker = writeReadData(scale, workDir, rng)
+  return lambda: float(readFormattedBinaryMLFile(worker, "data").sum()), {"rows": NUM_TRAIN_ROWS*scale, "dims": NUM_DIMS}
+
+def setupReadWarm(scale, workDir, rng): # later reads: memory-mapped sidecar
+  from utils import readFormattedBinaryMLFile
+  worker = writeReadData(scale, workDir, rng)
+  readFormattedBinaryMLFile(worker, "data") # writes the sidecar
+  return lambda: float(readFormattedBinaryMLFile(worker, "data").sum()), {"rows": NUM_TRAIN_ROWS*scale, "dims": NUM_DIMS}
+
+def setupDesign(scale, workDir, rng):
+  df = syntheticCharacterTable(NUM_CHARACTERS*scale, rng)
+  return lambda: buildDesign(df)[0].shape, {"characters": df.shape[0], "intervals": NUM_INTERVALS}
+
+def setupSurvival(scale, workDir, rng): # means, quantiles and survival ages, like the Bayesian predictors
+  from survival import survival_summaries
+  params = (rng.random((NUM_CHARACTERS*scale, NUM_COVARIATES)) < 0.2).astype(float)
+  beta = rng.normal(0, 0.3, (NUM_TRACE_SAMPLES, NUM_COVARIATES))
+  lambda0 = rng.gamma(1.0, 0.02, (NUM_TRACE_SAMPLES, NUM_INTERVALS))
+  return lambda: survival_summaries(beta, lambda0, params, 1, max_bytes=SURVIVAL_MAX_BYTES)["mean"].shape, {"characters": params.shape[0], "samples": NUM_TRACE_SAMPLES, "intervals": NUM_INTERVALS, "maxBytes": SURVIVAL_MAX_BYTES}
+
+def setupNeural(scale, workDir, rng):
+  from npmodel import NumpyModel
+  sizes = [NUM_DIMS] + V2_LAYERS
+  layers = [(rng.normal(0, 0.05, (sizes[i], sizes[i + 1])).astype(np.float32), np.zeros(sizes[i + 1], dtype=np.float32), "sigmoid" if i == len(V2_LAYERS) - 1 else "relu") for i in range(len(V2_LAYERS))]
+  model = NumpyModel(layers)
+  data = syntheticOneHotRows(NUM_CHARACTERS*scale*NUM_PREDICTION_YEARS, rng)
+  return lambda: model.predict(data).shape, {"rows": data.shape[0], "dims": NUM_DIMS}
+
+STAGES = {
+  "readFormattedBinaryMLFileCold": (setupReadCold, lambda scale: NUM_TRAIN_ROWS*scale*NUM_DIMS*4),
+  "readFormattedBinaryMLFileWarm": (setupReadWarm, lambda scale: NUM_TRAIN_ROWS*scale*NUM_DIMS*4),
+  "designMatrices": (setupDesign, lambda scale: NUM_CHARACTERS*scale*NUM_INTERVALS*8*4), # death, exposure and their temporaries
+  "survivalSummarization": (setupSurvival, lambda scale: NUM_CHARACTERS*scale*NUM_INTERVALS*8*5 + SURVIVAL_MAX_BYTES), # mean and quantiles, blocks
+  "neuralInference": (setupNeural, lambda scale: NUM_CHARACTERS*scale*NUM_PREDICTION_YEARS*(sum(n for _, _, n in BLOCKS) + NUM_SCALARS)*32), # incl. generating the sparse data
+}
+
+def runCase(stage, scale, seed, traceMemory=False): # executed in a child process, returns the measurements
+  # tracemalloc slows down every allocation, so a case is timed in one process and its memory is traced in another
+  workDir = tempfile.mkdtemp(prefix="got-benchmark-")
+  try:
+    run, size = STAGES[stage][0](scale, workDir, np.random.default_rng(seed))
+    if traceMemory:
+      tracemalloc.start()
+      run()
+      _, peakTraced = tracemalloc.get_traced_memory()
+      tracemalloc.stop()
+      return {"status": "ok", "peakTracedBytes": peakTraced}
+    setupRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+    wall, cpu = time.perf_counter(), time.process_time()
+    run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+  finally:
+    shutil.rmtree(workDir, ignore_errors=True)
+  peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024 # incl. the setup, the increase is the run's own share
+  return {"status": "ok", "wallSeconds": wall, "cpuSeconds": cpu, "peakRssBytes": peakRss, "peakRssIncreaseBytes": peakRss - setupRss, "size": size}
+
+def runChild(stage, scale, seed, timeout, traceMemory=False): # measurements of runCase in a child process, or the status of its failure
+  try:
+    out = subprocess.run([sys.executable, __file__, "--case", stage, str(scale), "--seed", str(seed)] + (["--trace-memory"] if traceMemory else []), stdout=subprocess.PIPE, timeout=timeout, check=True)
+    return json.loads(out.stdout.decode("utf-8").strip().splitlines()[-1])
+  except subprocess.TimeoutExpired:
+    return {"status": "timeout"}
+  except subprocess.CalledProcessError as e:
+    return {"status": "killed" if e.returncode < 0 else "failed", "returncode": e.returncode} # most likely out of memory when killed
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the predictor hot paths on synthetic data.")
+  parser.add_argument("--stages", nargs="+", choices=list(STAGES.keys()), default=list(STAGES.keys()))
+  parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100, 1000], help="multiples of the current number of characters (default: %(default)s)")
+  parser.add_argument("--max-gb", type=float, default=4.0, help="skip cases whose data would take more than this many GB (default: %(default)s)")
+  parser.add_argument("--timeout", type=float, default=300, help="seconds after which a case is stopped (default: %(default)s)")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--output", default=os.path.join(dirname, "output/benchmark-results.json"))
+  parser.add_argument("--no-trace-memory", action="store_true", help="skip the second run of every case, which traces the peak of the Python allocations")
+  parser.add_argument("--case", nargs=2, metavar=("STAGE", "SCALE"), help=argparse.SUPPRESS) # used internally for the child processes
+  parser.add_argument("--trace-memory", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.case:
+    print(json.dumps(runCase(args.case[0], int(args.case[1]), args.seed, args.trace_memory)))
+    sys.exit(0)
+
+  results = []
+  for stage in args.stages:
+    for scale in args.scales:
+      result = {"stage": stage, "scale": scale, "estimatedBytes": STAGES[stage][1](scale)}
+      if result["estimatedBytes"] > args.max_gb*1024**3:
+        result["status"] = "skipped"
+      else:
+        result.update(runChild(stage, scale, args.seed, args.timeout))
+        if result["status"] == "ok" and not args.no_trace_memory:
+          traced = runChild(stage, scale, args.seed, args.timeout, traceMemory=True)
+          result["peakTracedBytes"] = traced.get("peakTracedBytes")
+      print("%-26s %5dx  %-8s %s" % (stage, scale, result["status"], "%.3fs, %.1f MB peak RSS" % (result["wallSeconds"], result["peakRssBytes"]/1024**2) if result["status"] == "ok" else ""))
+      results.append(result)
+
+  # append this run to the results of the earlier ones
+  runs = []
+  if os.path.isfile(args.output):
+    with open(args.output, "r") as f:
+      runs = json.load(f)
+  runs.append({
+    "timestamp": datetime.datetime.now().isoformat(),
+    "git": subprocess.run(["git", "rev-parse", "HEAD"], cwd=dirname, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode("utf-8").strip(),
+    "machine": {"platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__, "cpus": os.cpu_count()},
+    "results": results,
+  })
+  os.makedirs(os.path.dirname(args.output), exist_ok=True)
+  with open(args.output, "w") as f:
+    json.dump(runs, f, indent=2)
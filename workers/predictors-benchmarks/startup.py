@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import subprocess
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+workersDir = os.path.join(dirname, "..")
+
+
+
+# Startup budget of the predictor entry points. Every entry point is started in its cheapest real mode: the Bayesian
+# predictors with --cached-only, i.e. they read their input, build the design matrices and summarize the survival
+# functions again from the cached trace (rewriting the same output), everything else with --help, i.e. it imports
+# what it needs at startup and exits. The wall time and peak RSS of that process are compared with a budget, and
+# none of the heavy libraries which are only needed for sampling or training may have been loaded by then. Entry
+# points whose mode needs a file which isn't there (e.g. no trace was cached yet) are skipped. Exits with 1 if any
+# budget is exceeded, results are appended to output/startup-results.json.
+
+# libraries which must only be loaded once the chosen mode needs them (or not at all)
+HEAVY_MODULES = ["pymc3", "theano", "keras", "tensorflow", "matplotlib", "seaborn"]
+
+# name -> cwd (relative to workers/), script, arguments (default: --help), a file or directory (relative to cwd) the
+# arguments need, and budget (seconds of wall time, MB of peak RSS)
+ENTRY_POINTS = {
+  "predictor-bayesean-book": {"cwd": "predictors-bayesian/predictor-bayesean-book", "script": "predictor.py", "args": ["--cached-only"], "requires": "trace-cache", "seconds": 3.0, "rssMB": 250},
+  "predictor-bayesean-show": {"cwd": "predictors-bayesian/predictor-bayesean-show", "script": "predictor.py", "args": ["--cached-only"], "requires": "trace-cache", "seconds": 3.0, "rssMB": 250},
+  "predictor-neural-v2": {"cwd": "predictors-neural/predictor-neural-v2", "script": "predictor.py", "seconds": 1.0, "rssMB": 100},
+  "predictor-neural-show-v1": {"cwd": "predictors-neural/predictor-neural-show-v1", "script": "predictor.py", "seconds": 1.0, "rssMB": 100},
+  "sweep": {"cwd": "predictors-neural/sweep", "script": "sweep.py", "seconds": 1.0, "rssMB": 100},
+  "columnar": {"cwd": "predictors-common", "script": "columnar.py", "seconds": 0.5, "rssMB": 60},
+  "service": {"cwd": "predictors-service", "script": "service.py", "seconds": 1.0, "rssMB": 100},
+}
+
+# runs the entry point like `python script args...` and writes the names of the loaded heavy modules to the given file
+WRAPPER = """
+import sys, json, runpy
+script, modulesFile = sys.argv[1], sys.argv[2]
+sys.argv = [script] + sys.argv[3:]
+sys.path.insert(0, ".")
+try:
+  runpy.run_path(script, run_name="__main__")
+except SystemExit as e: # --help exits with 0, anything else is a failed start
+  if e.code not in (0, None):
+    raise
+with open(modulesFile, "w") as f:
+  json.dump(sorted(set(m.split(".")[0] for m in sys.modules) & set(json.loads(%r))), f)
+""" % json.dumps(HEAVY_MODULES)
+
+def measureStartup(name): # wall time, peak RSS and loaded heavy modules of one start of the entry point
+  entry = ENTRY_POINTS[name]
+  cwd = os.path.join(workersDir, entry["cwd"])
+  required = os.path.join(cwd, entry["requires"]) if "requires" in entry else None
+  if required is not None and not (os.path.isfile(required) or (os.path.isdir(required) and os.listdir(required))):
+    return {"status": "skipped", "error": "%s is missing, run %s once without %s" % (entry["requires"], entry["script"], " ".join(entry["args"]))}
+  with tempfile.TemporaryDirectory() as tmp:
+    modulesFile = os.path.join(tmp, "modules.json")
+    with open(os.path.join(tmp, "stderr.log"), "w+b") as stderr: # not a pipe, which could fill up while waiting for the child
+      start = time.perf_counter()
+      process = subprocess.Popen([sys.executable, "-c", WRAPPER, entry["script"], modulesFile] + entry.get("args", ["--help"]), cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+      _, status, usage = os.wait4(process.pid, 0) # the resource usage of just this child
+      seconds = time.perf_counter() - start
+      process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+      stderr.seek(0)
+      error = stderr.read().decode("utf-8", "replace")
+    if process.returncode != 0 or not os.path.isfile(modulesFile):
+      return {"status": "failed", "error": error[-2000:]}
+    with open(modulesFile, "r") as f:
+      heavyModules = json.load(f)
+  rssBytes = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss*1024 # bytes on macOS, KiB on Linux
+  return {"status": "ok", "seconds": seconds, "peakRssBytes": rssBytes, "heavyModules": heavyModules}
+
+def checkBudget(name, result): # list of the exceeded budgets
+  entry = ENTRY_POINTS[name]
+  if result["status"] == "skipped":
+    return []
+  if result["status"] != "ok":
+    return ["failed to start"]
+  exceeded = []
+  if result["seconds"] > entry["seconds"]:
+    exceeded.append("%.2fs > %.2fs" % (result["seconds"], entry["seconds"]))
+  if result["peakRssBytes"] > entry["rssMB"]*1e6:
+    exceeded.append("%.0f MB > %d MB" % (result["peakRssBytes"]/1e6, entry["rssMB"]))
+  if result["heavyModules"]:
+    exceeded.append("loaded " + ", ".join(result["heavyModules"]))
+  return exceeded
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Check the startup time and memory of the predictor entry points against their budgets.")
+  parser.add_argument("entryPoints", nargs="*", metavar="ENTRY_POINT", help="entry points to check (default: all)")
+  parser.add_argument("--repeat", type=int, default=3, help="starts per entry point, the fastest one counts (default: %(default)s)")
+  parser.add_argument("--output", default=os.path.join(dirname, "output/startup-results.json"))
+  args = parser.parse_args()
+  for name in args.entryPoints:
+    if name not in ENTRY_POINTS:
+      parser.error("unknown entry point '%s', choose from: %s" % (name, ", ".join(ENTRY_POINTS.keys())))
+
+  results = {}
+  failed = False
+  for name in args.entryPoints or list(ENTRY_POINTS.keys()):
+    runs = [measureStartup(name) for _ in range(max(args.repeat, 1))]
+    ok = [r for r in runs if r["status"] == "ok"]
+    result = min(ok, key=lambda r: r["seconds"]) if len(ok) == len(runs) else [r for r in runs if r["status"] != "ok"][0]
+    result["exceeded"] = checkBudget(name, result)
+    result["budget"] = {"seconds": ENTRY_POINTS[name]["seconds"], "rssMB": ENTRY_POINTS[name]["rssMB"]}
+    results[name] = result
+    failed = failed or bool(result["exceeded"])
+    if result["status"] == "ok":
+      print("%-26s %6.2fs %6.0f MB  %s" % (name, result["seconds"], result["peakRssBytes"]/1e6, "; ".join(result["exceeded"]) or "ok"))
+    elif result["status"] == "skipped":
+      print("%-26s skipped, %s" % (name, result["error"]))
+    else:
+      print("%-26s failed to start:\n%s" % (name, result["error"]))
+
+  os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+  history = []
+  if os.path.isfile(args.output):
+    with open(args.output, "r") as f:
+      history = json.load(f)
+  history.append({"timestamp": datetime.datetime.now().isoformat(), "python": sys.version.split()[0], "results": results})
+  with open(args.output, "w") as f:
+    json.dump(history, f, indent=2)
+  sys.exit(1 if failed else 0)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import argparse
+import numpy as np
+from decimal import Decimal, ROUND_HALF_UP
+
+
+
+# Compact columnar prediction output: a .npz file with the names of the characters stored once, one array per
+# per-character field (first axis = characters) and the remaining top-level values as JSON. Floating point columns are
+# stored in their own precision or, quantized, as uint16 (with a per-column offset and scale, i.e. a resolution of
+# range/65535). For consumers which need JSON, exportJSON streams it character by character, optionally rounded to a
+# number of significant digits and formatted like JSON.stringify(..., 2) of the postprocessors (numbers="js").
+
+QUANTIZE_LEVELS = 65535
+
+def writeColumnar(filename, names, columns, meta=None, quantize=False, keep=None):
+  # columns: field name -> array with one row per character, keep: optional mask of the characters to write
+  keep = np.ones(len(names), dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+  arrays = {"names": np.array([n for n, k in zip(names, keep) if k], dtype=np.str_)}
+  scales = {}
+  for name, values in columns.items():
+    values = np.asarray(values)[keep]
+    if values.dtype.kind != "f":
+      arrays["column_" + name] = values
+    elif quantize:
+      low, high = (float(values.min()), float(values.max())) if values.size > 0 else (0.0, 0.0)
+      scale = (high - low)/QUANTIZE_LEVELS if high > low else 1.0
+      arrays["column_" + name] = np.rint((values - low)/scale).astype(np.uint16)
+      scales[name] = [low, scale]
+    else:
+      arrays["column_" + name] = values
+  arrays["meta"] = np.array(json.dumps({"meta": meta or {}, "columns": list(columns.keys()), "scales": scales}))
+  with open(filename + ".tmp", "wb") as f: # np.savez would append .npz to the temporary name
+    np.savez_compressed(f, **arrays)
+  os.replace(filename + ".tmp", filename)
+
+def readColumnar(filename): # (names, columns in their original type resp. float32 if quantized, meta)
+  with np.load(filename) as data:
+    info = json.loads(str(data["meta"]))
+    columns = {}
+    for name in info["columns"]:
+      values = data["column_" + name]
+      if name in info["scales"]:
+        low, scale = info["scales"][name]
+        values = (values*np.float32(scale) + np.float32(low)).astype(np.float32)
+      columns[name] = values
+    return data["names"].tolist(), columns, info["meta"]
+
+def roundSignificant(values, digits): # values rounded to the given number of significant digits
+  values = np.asarray(values, dtype=float)
+  magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1.0, values))))
+  exponent = (digits - 1 - magnitude).astype(int)
+  # multiply/divide by exact integer powers of 10 only, so that e.g. 0.123 isn't written as 0.12300000000000001
+  up = np.power(10.0, np.maximum(exponent, 0))
+  down = np.power(10.0, np.maximum(-exponent, 0))
+  return np.where(values == 0, 0.0, np.rint(values*up/down)*down/up)
+
+def jsNumber(value, digits=None):
+  # a number as JavaScript writes it, optionally rounded like +value.toPrecision(digits): toPrecision rounds the exact
+  # binary value half up, Number.prototype.toString writes the shortest digits, in exponent notation outside 1e-7..1e21
+  if not np.isfinite(value):
+    return "null"
+  d = Decimal(int(value)) if isinstance(value, (int, np.integer)) else Decimal(float(value))
+  if d == 0:
+    return "0"
+  if digits:
+    d = d.quantize(Decimal(1).scaleb(d.adjusted() - digits + 1), rounding=ROUND_HALF_UP)
+  elif not isinstance(value, (int, np.integer)):
+    d = Decimal(repr(float(value))) # the shortest digits which read back as the same double, like JavaScript's
+  sign, digitTuple, exponent = d.normalize().as_tuple()
+  text = "".join(map(str, digitTuple))
+  k, n = len(text), exponent + len(text) # value = 0.<text> * 10^n
+  if k <= n <= 21:
+    text = text + "0"*(n - k)
+  elif 0 < n <= 21:
+    text = text[:n] + "." + text[n:]
+  elif -6 < n <= 0:
+    text = "0." + "0"*(-n) + text
+  else:
+    text = text[0] + ("." + text[1:] if k > 1 else "") + "e" + ("+" if n > 0 else "-") + str(abs(n - 1))
+  return ("-" if sign else "") + text
+
+def pyNumber(value, digits=None): # a number as Python's json module writes it, optionally rounded
+  if isinstance(value, (int, np.integer)):
+    return str(int(value))
+  return json.dumps(float(roundSignificant(value, digits)) if digits else float(value))
+
+def dumpJSON(value, digits=None, indent=None, numbers="python", level=0):
+  # JSON text of plain values, lists, dicts and NumPy arrays/scalars; numbers are written and rounded like Python
+  # (json.dump) resp. JavaScript (JSON.stringify with a replacer returning +val.toPrecision(digits)) does
+  if isinstance(value, np.ndarray):
+    value = value.tolist()
+  elif isinstance(value, np.generic):
+    value = value.item()
+  if value is None or isinstance(value, bool):
+    return json.dumps(value)
+  if isinstance(value, (int, float)):
+    return jsNumber(value, digits) if numbers == "js" else pyNumber(value, digits)
+  if isinstance(value, str):
+    return json.dumps(value, ensure_ascii=numbers != "js") # JavaScript doesn't escape non-ASCII characters
+  if isinstance(value, dict):
+    items = [json.dumps(k, ensure_ascii=numbers != "js") + ": " + dumpJSON(v, digits, indent, numbers, level + 1) for k, v in value.items()]
+    return wrapJSON("{", items, "}", indent, level)
+  return wrapJSON("[", [dumpJSON(v, digits, indent, numbers, level + 1) for v in value], "]", indent, level)
+
+def wrapJSON(opening, items, closing, indent, level): # like json.dump resp. JSON.stringify, empty containers stay on one line
+  if not items:
+    return opening + closing
+  if indent is None:
+    return opening + ", ".join(items) + closing
+  inner, outer = "\n" + " "*(indent*(level + 1)), "\n" + " "*(indent*level)
+  return opening + inner + ("," + inner).join(items) + outer + closing
+
+def iterJSON(names, columns, meta, column=None, digits=None, indent=None, numbers="python"):
+  # yields the JSON text piece by piece, one piece per character: {"<meta>": ..., "characters": {"<name>": {"<column>":
+  # ...}}}, or, if a column is given, {"<name>": <value of that column>}. Same text as dumpJSON of the whole object.
+  ensureAscii = numbers != "js"
+  newline = lambda level: "" if indent is None else "\n" + " "*(indent*level)
+  separator = ", " if indent is None else ","
+  if column is None:
+    yield "{" + "".join(newline(1) + json.dumps(key, ensure_ascii=ensureAscii) + ": " + dumpJSON(value, digits, indent, numbers, 1) + separator for key, value in meta.items()) + newline(1) + '"characters": {'
+    level = 2
+  else:
+    yield "{"
+    level = 1
+  for i, name in enumerate(names):
+    value = {c: values[i] for c, values in columns.items()} if column is None else columns[column][i]
+    yield ("" if i == 0 else separator) + newline(level) + json.dumps(name, ensure_ascii=ensureAscii) + ": " + dumpJSON(value, digits, indent, numbers, level)
+  yield (newline(level - 1) if len(names) > 0 else "") + "}" + (newline(0) + "}" if column is None else "")
+
+def exportJSON(filename, outfile, column=None, digits=None, indent=None, numbers="python"):
+  names, columns, meta = readColumnar(filename)
+  with open(outfile, "w", encoding="utf-8") as f:
+    for piece in iterJSON(names, columns, meta, column, digits, indent, numbers):
+      f.write(piece)
+
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Export a columnar prediction output to JSON.")
+  parser.add_argument("infile")
+  parser.add_argument("outfile")
+  parser.add_argument("--column", help="only export this column, as {name: value}")
+  parser.add_argument("--digits", type=int, default=None, help="round numbers to this many significant digits")
+  parser.add_argument("--indent", type=int, default=None, help="indent nested values by this many spaces, like json.dump resp. JSON.stringify")
+  parser.add_argument("--numbers", choices=["python", "js"], default="python", help="write (and round) numbers like Python's json module (default) or like JavaScript's JSON.stringify with +val.toPrecision(digits), as the postprocessors do")
+  args = parser.parse_args()
+  exportJSON(args.infile, args.outfile, args.column, args.digits, args.indent, args.numbers)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+
+# Incremental re-prediction: a content hash of the feature rows of every character is stored next to the outputs,
+# together with a key of the model (or trace) the outputs were computed with. As long as that key doesn't change, only
+# characters which are new or whose hash changed need to be predicted again, their results are merged into the
+# existing outputs. Characters which disappeared from the input are dropped.
+
+def arraysHash(arrays): # hash of the contents, shapes and types of the given arrays (or strings)
+  h = hashlib.sha1()
+  for a in arrays:
+    if isinstance(a, str):
+      h.update(a.encode("utf-8"))
+    else:
+      a = np.ascontiguousarray(a)
+      h.update(str((a.dtype.str, a.shape)).encode("utf-8"))
+      h.update(a.tobytes())
+  return h.hexdigest()
+
+def itemHashes(data, numItems, extra=None): # hash per item, every item spans data.shape[0] // numItems consecutive rows
+  # extra: optional per item arrays (e.g. the ages a static row is unfolded with) which are hashed along with the rows
+  rowsPerItem = data.shape[0] // numItems if numItems > 0 else 0
+  hashes = []
+  for i in range(numItems):
+    rows = data[i*rowsPerItem:(i + 1)*rowsPerItem]
+    rows = rows.toarray() if hasattr(rows, "toarray") else np.asarray(rows, dtype=np.float32) # sparse or dense
+    hashes.append(arraysHash([rows] if extra is None else [rows, extra[i]]))
+  return hashes
+
+def loadState(filename):
+  try:
+    with open(filename, "r") as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return None
+
+def saveState(filename, model, names, hashes):
+  with open(filename + ".tmp", "w") as f:
+    json.dump({"model": model, "hashes": dict(zip(names, hashes))}, f)
+  os.replace(filename + ".tmp", filename)
+
+def changedItems(state, model, names, hashes, present=()): # indexes of the items which have to be (re-)computed
+  # present: names of the items in the existing outputs, the others are computed even if their hash didn't change
+  if state is None or state.get("model") != model:
+    return np.arange(len(names))
+  previous = state.get("hashes", {})
+  return np.array([i for i, (name, h) in enumerate(zip(names, hashes)) if previous.get(name) != h or name not in present], dtype=np.int64)
+
+def mergeByName(names, recomputed, previous): # dict in the order of names, recomputed values take precedence
+  return {name: recomputed[name] if name in recomputed else previous[name] for name in names}
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import resource
+import datetime
+import contextlib
+
+
+
+# Lightweight per-stage instrumentation shared by the Bayesian and neural predictors. Every named stage records its
+# wall time, CPU time and the process' peak RSS (the high-water mark after the stage and how much the stage raised it),
+# and the sampler throughput can be added. A run report is written as JSON next to the outputs.
+#
+# Disabled unless the environment variable PREDICTORS_REPORT is set (to anything but "0"), in which case stage() only
+# costs a function call. PREDICTORS_PROFILE=cprofile additionally profiles the whole run (stats are written next to the
+# report, with the top functions in the report itself), PREDICTORS_PROFILE=tracemalloc records the peak of the memory
+# allocated by Python (incl. NumPy arrays) per stage and the top allocation sites.
+
+PROFILERS = ["cprofile", "tracemalloc"]
+TOP_ENTRIES = 25
+
+def peakRssBytes(): # high-water mark of the resident set size of this process
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return maxrss if sys.platform == "darwin" else maxrss*1024 # bytes on macOS, KiB on Linux
+
+def currentRssBytes():
+  try:
+    with open("/proc/self/statm", "r") as f:
+      return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+  except (IOError, OSError, ValueError):
+    return None
+
+class Instrumentation:
+  def __init__(self, enabled=False, profile=None):
+    if profile is not None and profile not in PROFILERS:
+      raise ValueError("unknown profiler: " + profile)
+    self.enabled = enabled
+    self.profile = profile if enabled else None
+    self.stages = []
+    self.values = {}
+    self.start = time.perf_counter()
+    self.startCpu = time.process_time()
+    self.profiler = None
+    if self.profile == "cprofile":
+      import cProfile
+      self.profiler = cProfile.Profile()
+      self.profiler.enable()
+    elif self.profile == "tracemalloc":
+      import tracemalloc
+      tracemalloc.start()
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    if not self.enabled:
+      yield
+      return
+    if self.profile == "tracemalloc":
+      import tracemalloc
+      tracemalloc.reset_peak()
+    peakBefore = peakRssBytes()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+      yield
+    finally:
+      entry = {
+        "name": name,
+        "wallSeconds": time.perf_counter() - wall,
+        "cpuSeconds": time.process_time() - cpu,
+        "peakRssBytes": peakRssBytes(),
+        "rssBytes": currentRssBytes(),
+      }
+      entry["peakRssIncreaseBytes"] = entry["peakRssBytes"] - peakBefore
+      if self.profile == "tracemalloc":
+        entry["peakTracedBytes"] = tracemalloc.get_traced_memory()[1]
+      self.stages.append(entry)
+
+  def record(self, name, value): # any additional value for the report, e.g. a number of rows
+    if self.enabled:
+      self.values[name] = value
+
+  def recordSampler(self, info): # throughput of the sampler, from the info returned by run_inference
+    if not self.enabled:
+      return
+    sampler = {"method": info.get("method"), "cached": info.get("cached", False)}
+    if not sampler["cached"] and info.get("seconds"):
+      sampler["seconds"] = info["seconds"]
+      sampler["drawsPerSecond"] = info["draws"]/info["seconds"]
+      if "tune" in info: # tuning steps take about as long as draws
+        sampler["stepsPerSecond"] = (info["drawsPerChain"] + info["tune"])*info["chains"]/info["seconds"]
+    if "diagnostics" in info and "divergences" in info["diagnostics"]:
+      sampler["divergences"] = info["diagnostics"]["divergences"]
+    if "iterations" in info:
+      sampler["iterations"] = info["iterations"]
+    self.values["sampler"] = sampler
+
+  def report(self):
+    return {
+      "timestamp": datetime.datetime.now().isoformat(),
+      "script": os.path.abspath(sys.argv[0]),
+      "args": sys.argv[1:],
+      "wallSeconds": time.perf_counter() - self.start,
+      "cpuSeconds": time.process_time() - self.startCpu,
+      "peakRssBytes": peakRssBytes(),
+      "stages": self.stages,
+      "values": self.values,
+    }
+
+  def write(self, filename): # writes the run report (and the profile, if any); nothing happens when disabled
+    if not self.enabled:
+      return
+    report = self.report()
+    if self.profile == "cprofile":
+      import io
+      import pstats
+      self.profiler.disable()
+      profileFile = os.path.splitext(filename)[0] + ".prof"
+      self.profiler.dump_stats(profileFile)
+      stream = io.StringIO()
+      pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+      report["profile"] = {"file": profileFile, "top": stream.getvalue().splitlines()}
+    elif self.profile == "tracemalloc":
+      import tracemalloc
+      stats = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ENTRIES]
+      report["profile"] = {"topAllocations": [{"location": str(s.traceback), "bytes": s.size, "count": s.count} for s in stats]}
+    with open(filename, "w") as f:
+      json.dump(report, f, indent=2)
+
+def fromEnvironment(): # instrumentation as configured by PREDICTORS_REPORT and PREDICTORS_PROFILE
+  enabled = os.environ.get("PREDICTORS_REPORT", "0") not in ("", "0")
+  return Instrumentation(enabled, os.environ.get("PREDICTORS_PROFILE") or None)
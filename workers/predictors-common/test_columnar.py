@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from columnar import writeColumnar, readColumnar, exportJSON, jsNumber
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+
+
+# fixtures/book_predictions.json was written by workers/postprocessor-bayesean-book from
+# fixtures/book_predictor_output.json, whose values include ties and exponents where Python and JavaScript differ.
+
+META = ["attributes", "meanBetaExp", "survivalFunctionQuantileLevels"]
+FIELDS = ["age", "predictedSurvivalAge", "confIntervalLower", "confIntervalHigher", "confIntervalConfidence", "survivalFunctionMean", "survivalFunctionQuantiles"]
+
+class ColumnarTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def test_postprocessor_output(self): # written the way the Bayesian predictors do, exported like the postprocessor
+    with open(os.path.join(dirname, "fixtures/book_predictor_output.json"), "r") as f:
+      predictions = json.load(f)
+    chars = predictions["characters"]
+    columnar = os.path.join(self.tmp, "book_predictions.npz")
+    writeColumnar(columnar, [ch["name"] for ch in chars], {field: [ch[field] for ch in chars] for field in FIELDS}, {key: predictions[key] for key in META}, keep=[ch["alive"] for ch in chars])
+    exportJSON(columnar, os.path.join(self.tmp, "book_predictions.json"), digits=3, indent=2, numbers="js")
+    with open(os.path.join(dirname, "fixtures/book_predictions.json"), "rb") as f:
+      expected = f.read()
+    with open(os.path.join(self.tmp, "book_predictions.json"), "rb") as f:
+      self.assertEqual(f.read(), expected)
+
+  def test_neural_predictions(self): # a single column, like writeJSON(..., pretty=True) of the neural predictors
+    names = ["Jon Snow", "Ser Jörah Mormont", "Arya Stark"]
+    matrix = np.random.default_rng(0).random((3, 21)).astype(np.float32)
+    columnar = os.path.join(self.tmp, "predictions.npz")
+    writeColumnar(columnar, names, {"predictions": matrix})
+    exportJSON(columnar, os.path.join(self.tmp, "predictions.json"), column="predictions", indent=4)
+    with open(os.path.join(self.tmp, "predictions.json"), "r", encoding="utf-8") as f:
+      self.assertEqual(f.read(), json.dumps(dict(zip(names, matrix.tolist())), indent=4))
+
+  def test_compact_and_empty(self):
+    columnar = os.path.join(self.tmp, "empty.npz")
+    writeColumnar(columnar, [], {"plod": np.zeros(0)}, {"attributes": []})
+    exportJSON(columnar, os.path.join(self.tmp, "empty.json"), indent=2)
+    exportJSON(columnar, os.path.join(self.tmp, "compact.json"))
+    with open(os.path.join(self.tmp, "empty.json"), "r") as f:
+      self.assertEqual(f.read(), json.dumps({"attributes": [], "characters": {}}, indent=2))
+    with open(os.path.join(self.tmp, "compact.json"), "r") as f:
+      self.assertEqual(f.read(), json.dumps({"attributes": [], "characters": {}}))
+
+  def test_js_numbers(self):
+    for value, expected in [(25.0, "25"), (1e-05, "0.00001"), (1e-07, "1e-7"), (1.5e21, "1.5e+21"), (-0.0, "0"), (0.1, "0.1"), (float("nan"), "null")]:
+      self.assertEqual(jsNumber(value), expected)
+    for value, expected in [(0.1235, "0.123"), (1.005, "1"), (2.675, "2.67"), (0.9995, "1"), (1234, "1230"), (1.2345e-07, "1.23e-7")]:
+      self.assertEqual(jsNumber(value, 3), expected) # like +value.toPrecision(3)
+
+  def test_roundtrip(self):
+    columnar = os.path.join(self.tmp, "roundtrip.npz")
+    values = np.random.default_rng(1).random((4, 3))
+    writeColumnar(columnar, ["a", "b", "c", "d"], {"values": values, "ints": np.arange(4)}, {"k": 1})
+    names, columns, meta = readColumnar(columnar)
+    self.assertEqual(names, ["a", "b", "c", "d"])
+    np.testing.assert_array_equal(columns["values"], values)
+    np.testing.assert_array_equal(columns["ints"], np.arange(4))
+    self.assertEqual(meta, {"k": 1})
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,54 @@
+import json
+import random
+import numpy as np
+
+
+
+# Network architectures and training settings of the predictors. A config has the widths of the hidden ReLU layers
+# (every one followed by a Dropout layer), the dropout rate, the optimizer and the training settings; the sweep runner
+# (../sweep/sweep.py) varies these and its best config can be used for training with --train --config.
+
+ARCHITECTURES = {
+  "v2": {"layers": [500, 250, 100], "dropout": 0.8, "optimizer": "rmsprop", "epochs": 5, "batchSize": 32, "validationSplit": 0.2},
+  "show-v1": {"layers": [1000, 500, 250, 100], "dropout": 0.7, "optimizer": "rmsprop", "epochs": 8, "batchSize": 32, "validationSplit": 0.1},
+}
+
+def architectureConfig(name, overrides=None): # config of the given predictor, with the given keys replaced
+  config = dict(ARCHITECTURES[name])
+  config.update(overrides or {})
+  return config
+
+def readConfigFile(filename): # settings replacing those of an architecture, either a config or a sweep trial (with "config")
+  with open(filename, "r") as f:
+    config = json.load(f)
+  return config.get("config", config)
+
+def seedEverything(seed): # Python, NumPy and Keras/TensorFlow random generators, call it before building the model
+  random.seed(seed)
+  np.random.seed(seed)
+  import keras
+  if hasattr(keras.utils, "set_random_seed"):
+    keras.utils.set_random_seed(seed)
+  else: # older Keras versions on TensorFlow
+    import tensorflow as tf
+    if hasattr(tf.random, "set_seed"):
+      tf.random.set_seed(seed)
+    else: # TensorFlow 1.x
+      tf.set_random_seed(seed)
+
+def buildModel(config, numOutputs=1): # Keras model of the given config (Keras is only needed for training)
+  from keras.models import Sequential
+  from keras.layers import Dropout, Dense
+  model = Sequential()
+  for width in config["layers"]:
+    model.add(Dense(width, activation='relu'))
+    model.add(Dropout(config["dropout"]))
+  model.add(Dense(numOutputs, activation='sigmoid'))
+  model.compile(optimizer=config["optimizer"], loss='binary_crossentropy', metrics=['accuracy'])
+  return model
+
+def historyMetric(history, name): # last value of a metric of a Keras History, "acc" resp. "accuracy" depending on the version
+  values = history.history.get(name)
+  if values is None:
+    values = history.history.get(name.replace("accuracy", "acc"))
+  return float(values[-1]) if values else None
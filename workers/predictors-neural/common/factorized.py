@@ -0,0 +1,28 @@
+import numpy as np
+import scipy.sparse
+
+from npmodel import activate, forwardDense, denseLayersOf
+from unfolding import unfoldedAgeColumns
+
+
+
+# Factorized inference for the unfolded (character, age) samples: the first Dense layer computes W^T x + b, and as
+# x = x_static + onehot(age), this equals (W^T x_static + b) + W[age]. The static part is only computed once per
+# character, for every unfolded sample just one row of W is added before the remaining layers are applied as usual.
+
+def predictFactorized(layers, static, charIdx, columns, batchSize=4096):
+  # static: one row per character, charIdx/columns: character and one-hot column of every sample to predict
+  kernel, bias, activation = layers[0]
+  staticPart = static.dot(kernel) if scipy.sparse.issparse(static) else np.asarray(static, dtype=np.float32).dot(kernel)
+  staticPart = np.asarray(staticPart) + bias # characters x units of the first layer
+  ret = []
+  for i in range(0, charIdx.size, batchSize):
+    chars, cols = charIdx[i:i + batchSize], columns[i:i + batchSize]
+    # a one-hot column the static row has set already stays 1 (possible as ages aren't relative to the minimum age)
+    unset = 1.0 - np.asarray(static[chars, cols], dtype=np.float32).reshape((-1, 1))
+    hidden = activate(staticPart[chars] + kernel[cols]*unset, activation)
+    ret.append(forwardDense(layers[1:], hidden))
+  return np.concatenate(ret).astype(np.float32)
+
+def predictUnfoldedFactorized(model, unfolding, batchSize=4096): # same as predictUnfoldedModel, but factorized
+  return predictFactorized(denseLayersOf(model), unfolding["static"], unfolding["charIdx"], unfoldedAgeColumns(unfolding), batchSize)
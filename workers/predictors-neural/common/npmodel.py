@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import scipy.sparse
+
+
+
+# Pure NumPy inference for the trained predictors, which are just stacks of Dense (and, when training, Dropout)
+# layers. exportModel extracts kernels, biases and activations of a Keras model into a small .npz file, NumpyModel
+# loads such a file and offers the predict methods of a Keras model, without ever importing Keras/TensorFlow.
+
+def softmax(x):
+  e = np.exp(x - x.max(axis=-1, keepdims=True))
+  return e/e.sum(axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+  "linear": lambda x: x,
+  "relu": lambda x: np.maximum(x, 0),
+  "sigmoid": lambda x: 1.0/(1.0 + np.exp(-x)),
+  "tanh": np.tanh,
+  "softmax": softmax,
+}
+
+def activate(x, name):
+  if name not in ACTIVATIONS:
+    raise ValueError("unsupported activation: " + name)
+  return ACTIVATIONS[name](x)
+
+def forwardDense(layers, x): # applies the given (kernel, bias, activation name) layers to x
+  for kernel, bias, activation in layers:
+    x = activate(x.dot(kernel) + bias, activation)
+  return x
+
+class NumpyModel:
+  def __init__(self, denseLayers):
+    self.denseLayers = denseLayers
+
+  def predict(self, x, batchSize=1024, verbose=0):
+    ret = [self.predict_on_batch(x[i:i + batchSize]) for i in range(0, x.shape[0], batchSize)]
+    return np.concatenate(ret) if ret else np.zeros((0, self.denseLayers[-1][0].shape[1]), dtype=np.float32)
+
+  def predict_on_batch(self, x):
+    x = x.toarray() if scipy.sparse.issparse(x) else np.asarray(x, dtype=np.float32)
+    return forwardDense(self.denseLayers, x).astype(np.float32)
+
+def denseLayersOf(model): # (kernel, bias, activation name) of every Dense layer, Dropout is a no-op when predicting
+  if isinstance(model, NumpyModel):
+    return model.denseLayers
+  layers = []
+  for layer in model.layers:
+    kind = type(layer).__name__
+    if kind == "Dense":
+      kernel, bias = layer.get_weights()
+      layers.append((kernel, bias, layer.get_config()["activation"]))
+    elif kind not in ["Dropout", "InputLayer"]:
+      raise ValueError("unsupported layer for NumPy inference: " + kind)
+  return layers
+
+def exportModel(model, filename):
+  arrays = {}
+  for i, (kernel, bias, activation) in enumerate(denseLayersOf(model)):
+    arrays["kernel%d" % i] = np.asarray(kernel, dtype=np.float32)
+    arrays["bias%d" % i] = np.asarray(bias, dtype=np.float32)
+    arrays["activation%d" % i] = np.array(activation)
+  np.savez(filename, numLayers=np.array(len(arrays) // 3), **arrays)
+
+def loadNumpyModel(filename):
+  with np.load(filename, allow_pickle=False) as f:
+    return NumpyModel([(f["kernel%d" % i], f["bias%d" % i], str(f["activation%d" % i])) for i in range(int(f["numLayers"]))])
+
+def loadPredictorModel(modelsDir): # NumPy version of models/got-predictor-model.h5, (re-)exported first if it's missing or outdated
+  h5File = os.path.join(modelsDir, "got-predictor-model.h5")
+  npzFile = os.path.join(modelsDir, "got-predictor-model.npz")
+  if not os.path.isfile(npzFile) or (os.path.isfile(h5File) and os.path.getmtime(h5File) > os.path.getmtime(npzFile)):
+    from keras.models import load_model # only needed once after every training
+    exportModel(load_model(h5File, compile=False), npzFile)
+  return loadNumpyModel(npzFile)
@@ -0,0 +1,92 @@
+import os
+import zlib
+import struct
+import numpy as np
+import scipy.sparse
+
+from utils import dirname, readFormattedBinaryMLFile
+
+
+
+# Reading of the sparse (CSR) variant of the formatter-neural binary files (see writeOutputDataBinarySparse in
+# workers/common/utils.js) and feeding such data to Keras by densifying only one mini-batch at a time.
+
+def readFormattedSparseMLByteArray(f):
+  num, len, nnz = struct.unpack("<III", f[0:12])
+  offset = 12
+  indptr = np.frombuffer(f, dtype=np.uint32, count=num + 1, offset=offset)
+  offset += 4*(num + 1)
+  indices = np.frombuffer(f, dtype=np.uint32, count=nnz, offset=offset)
+  offset += 4*nnz
+  values = np.frombuffer(f, dtype=np.float32, count=nnz, offset=offset)
+  return scipy.sparse.csr_matrix((values, indices.astype(np.int32), indptr.astype(np.int64)), shape=(num, len))
+
+def sparseMLFilename(worker, name):
+  return os.path.join(dirname, "../../" + worker + "/output/" + name + ".spdat")
+
+def hasFormattedSparseMLFile(worker, name): # true if there is a sparse version which is newer than a dense one
+  denseFilename = os.path.join(dirname, "../../" + worker + "/output/" + name + ".dat")
+  mtime = lambda fn: max([os.path.getmtime(f) for f in [fn, fn + ".gz"] if os.path.isfile(f)] or [None])
+  sparseTime = mtime(sparseMLFilename(worker, name))
+  denseTime = mtime(denseFilename)
+  return sparseTime is not None and (denseTime is None or sparseTime >= denseTime)
+
+def readFormattedSparseMLFile(worker, name):
+  filename = sparseMLFilename(worker, name)
+  if os.path.isfile(filename):
+    with open(filename, "rb") as f:
+      return readFormattedSparseMLByteArray(f.read())
+  else:
+    with open(filename + ".gz", "rb") as f:
+      return readFormattedSparseMLByteArray(zlib.decompress(f.read()))
+
+def readFormattedBookMLFile(name): # sparse matrix if the formatter wrote a sparse file, dense array otherwise
+  if hasFormattedSparseMLFile("formatter-neural", name):
+    return readFormattedSparseMLFile("formatter-neural", name)
+  return readFormattedBinaryMLFile("formatter-neural", name)
+
+def readFormattedShowMLFile(name):
+  if hasFormattedSparseMLFile("formatter-neural-show", name):
+    return readFormattedSparseMLFile("formatter-neural-show", name)
+  return readFormattedBinaryMLFile("formatter-neural-show", name)
+
+
+
+def iterateDenseBatches(data, labels=None, batchSize=32, rows=None, shuffle=False, loop=False):
+  # yields dense mini-batches (data or (data, labels)) of the given rows; loops forever (reshuffling every pass) if loop is set
+  rows = np.arange(data.shape[0]) if rows is None else np.asarray(rows)
+  while True:
+    order = np.random.permutation(rows) if shuffle else rows
+    for i in range(0, order.size, batchSize):
+      batchRows = np.sort(order[i:i + batchSize]) # sorted rows are faster to slice from a CSR matrix
+      batch = data[batchRows].toarray() if scipy.sparse.issparse(data) else np.asarray(data[batchRows])
+      yield batch if labels is None else (batch, np.asarray(labels[batchRows]))
+    if not loop:
+      return
+
+def numBatches(numRows, batchSize):
+  return (numRows + batchSize - 1) // batchSize
+
+def fitGenerator(model, generator, steps, epochs, validation=None, validationSteps=None): # fit with a looping batch generator
+  # fit takes generators since Keras 2.4, fit_generator is gone in Keras 3
+  validation = {} if validation is None else {"validation_data": validation, "validation_steps": validationSteps}
+  return model.fit(generator, steps_per_epoch=steps, epochs=epochs, shuffle=False, **validation) # the generator shuffles
+
+def fitModel(model, data, labels, epochs, batchSize, validationSplit=0.0):
+  # like model.fit(data, labels, ...), but densifies sparse data one mini-batch at a time
+  if not scipy.sparse.issparse(data):
+    return model.fit(data, labels, epochs=epochs, batch_size=batchSize, validation_split=validationSplit)
+  numTrain = int(data.shape[0]*(1.0 - validationSplit)) # like Keras, the last rows are used for validation
+  trainRows, validationRows = np.arange(numTrain), np.arange(numTrain, data.shape[0])
+  validation = iterateDenseBatches(data, labels, batchSize, validationRows, loop=True) if validationRows.size > 0 else None
+  return fitGenerator(model, iterateDenseBatches(data, labels, batchSize, trainRows, shuffle=True, loop=True), numBatches(trainRows.size, batchSize), epochs, validation, numBatches(validationRows.size, batchSize))
+
+def selectItemRows(data, items, numItems): # rows of the given items (sorted), every item spans data.shape[0] // numItems rows
+  rowsPerItem = data.shape[0] // numItems
+  rows = (np.asarray(items, dtype=np.int64).reshape((-1, 1))*rowsPerItem + np.arange(rowsPerItem)).reshape(-1)
+  return data[rows] if scipy.sparse.issparse(data) else np.asarray(data[rows])
+
+def predictModel(model, data, batchSize=256): # like model.predict(data), but densifies sparse data one mini-batch at a time
+  if not scipy.sparse.issparse(data):
+    return model.predict(data)
+  return np.concatenate([model.predict_on_batch(batch) for batch in iterateDenseBatches(data, batchSize=batchSize)])
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import numpy as np
+import scipy.sparse
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+from sparse import fitModel, predictModel
+from architectures import architectureConfig, buildModel, seedEverything, historyMetric
+
+
+
+class SparseTest(unittest.TestCase):
+  def test_fit_csr(self): # one epoch on a tiny CSR input, densified one mini-batch at a time
+    rng = np.random.default_rng(0)
+    data = scipy.sparse.random(40, 12, density=0.2, format="csr", random_state=0, dtype=np.float32)
+    labels = (rng.random((40, 1)) < 0.5).astype(np.float32)
+    seedEverything(0)
+    model = buildModel(architectureConfig("v2", {"layers": [8], "dropout": 0.5}))
+    history = fitModel(model, data, labels, epochs=1, batchSize=16, validationSplit=0.25)
+    self.assertIsNotNone(historyMetric(history, "loss"))
+    self.assertIsNotNone(historyMetric(history, "val_loss"))
+    self.assertEqual(predictModel(model, data, batchSize=16).shape, (40, 1))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
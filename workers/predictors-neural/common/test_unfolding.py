@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import unittest
+import numpy as np
+import scipy.sparse
+
+from unfolding import unfoldingFromMeta, createUnfoldedBatch, numUnfoldedSamples, iterateUnfoldedBatches, predictUnfoldedModel, fitUnfoldedModel
+from factorized import predictUnfoldedFactorized
+from npmodel import NumpyModel
+from architectures import architectureConfig, buildModel, seedEverything, historyMetric
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+
+
+# fixtures/unfolding.json was written with JoinedOneHotVector of workers/common/utils.js the way
+# formatter-neural/index-v2.js writes its data, with and without --static, for characters whose ages start at 3
+
+class UnfoldingTest(unittest.TestCase):
+  def setUp(self):
+    with open(os.path.join(dirname, "fixtures/unfolding.json"), "r") as f:
+      self.fixture = json.load(f)
+
+  def unfolding(self, part, sparse=False):
+    static = np.array(self.fixture["static"][part], dtype=np.float32)
+    return unfoldingFromMeta(self.fixture["unfolding"], part, scipy.sparse.csr_matrix(static) if sparse else static)
+
+  def test_train_like_js(self): # on-the-fly unfolding of the static rows gives the rows unfolded by the formatter
+    self.assertNotEqual(self.fixture["unfolding"]["min"], 0)
+    for sparse in [False, True]:
+      unfolding = self.unfolding("train", sparse)
+      batch = createUnfoldedBatch(unfolding, np.arange(numUnfoldedSamples(unfolding)))
+      np.testing.assert_array_equal(batch, self.fixture["unfolded"]["train"])
+      np.testing.assert_array_equal(unfolding["labels"], self.fixture["labels"])
+
+  def test_predict_like_js(self): # ages beyond the range are clamped, like rangeValModifier of the formatter
+    unfolding = self.unfolding("predict")
+    self.assertIsNone(unfolding["labels"])
+    np.testing.assert_array_equal(np.concatenate(list(iterateUnfoldedBatches(unfolding, batchSize=3))), self.fixture["unfolded"]["predict"])
+
+  def test_factorized_like_batches(self): # also where the age one-hot overlaps the next block, as the ages start at 3
+    rng = np.random.default_rng(0)
+    model = NumpyModel([(rng.normal(size=(9, 4)).astype(np.float32), np.zeros(4, dtype=np.float32), "relu"), (rng.normal(size=(4, 1)).astype(np.float32), np.zeros(1, dtype=np.float32), "sigmoid")])
+    for sparse in [False, True]:
+      unfolding = self.unfolding("train", sparse)
+      np.testing.assert_allclose(predictUnfoldedFactorized(model, unfolding, batchSize=4), predictUnfoldedModel(model, unfolding), rtol=1e-5)
+
+  def test_fit(self): # one epoch on the samples unfolded on the fly
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    seedEverything(0)
+    model = buildModel(architectureConfig("show-v1", {"layers": [8], "dropout": 0.5}))
+    history = fitUnfoldedModel(model, self.unfolding("train", sparse=True), epochs=1, batchSize=4, validationSplit=0.2)
+    self.assertIsNotNone(historyMetric(history, "loss"))
+    self.assertIsNotNone(historyMetric(history, "val_loss"))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,107 @@
+import os
+import json
+import numpy as np
+import scipy.sparse
+
+from utils import dirname, readFormattedBinaryMLFile
+from sparse import hasFormattedSparseMLFile, readFormattedSparseMLFile, numBatches, fitGenerator
+
+
+
+# On-the-fly unfolding of the data written by the neural formatters with --static: instead of one row per character
+# and age, there is only one static row per character (with an empty age block) and, per character, the range of ages
+# it has to be unfolded with. Every (character, age) sample is created only when its mini-batch is needed.
+
+def unfoldingFilename(worker, version):
+  return os.path.join(dirname, "../../" + worker + "/output/" + version + "-unfolding.json")
+
+def hasUnfoldingMLFile(worker, version): # true if the static data is newer than the pre-unfolded one
+  filename = unfoldingFilename(worker, version)
+  if not os.path.isfile(filename):
+    return False
+  unfolded = [os.path.join(dirname, "../../" + worker + "/output/" + version + "-data-train" + ext) for ext in [".dat", ".dat.gz", ".spdat", ".spdat.gz"]]
+  return all(os.path.getmtime(filename) >= os.path.getmtime(f) for f in unfolded if os.path.isfile(f))
+
+def readUnfoldingMLFile(worker, version, part): # part is "train" or "predict"
+  with open(unfoldingFilename(worker, version), "r") as f:
+    meta = json.load(f)
+  name = version + "-static-" + part
+  static = readFormattedSparseMLFile(worker, name) if hasFormattedSparseMLFile(worker, name) else readFormattedBinaryMLFile(worker, name)
+  return unfoldingFromMeta(meta, part, static)
+
+def unfoldingFromMeta(meta, part, static): # the unfolding of the static rows, from the meta data written by the formatter
+  chars = meta[part]
+  counts = np.array([c["count"] for c in chars], dtype=np.int64)
+  charIdx = np.repeat(np.arange(len(chars)), counts) # one entry per unfolded sample, character by character
+  firstSample = np.repeat(np.cumsum(counts) - counts, counts)
+  ages = np.repeat([c["start"] for c in chars], counts) + np.arange(counts.sum()) - firstSample
+  ages = np.clip(ages, meta["min"], meta["max"])
+  labels = None
+  if all("age" in c for c in chars): # a character is alive at all ages up to its actual age
+    labels = (np.array([c["age"] for c in chars])[charIdx] >= ages).astype(np.float32).reshape((-1, 1))
+  return {"static": static, "offset": meta["offset"], "min": meta["min"], "charIdx": charIdx, "ages": ages, "labels": labels}
+
+def readUnfoldingBookMLFile(version, part):
+  return readUnfoldingMLFile("formatter-neural", version, part)
+
+def readUnfoldingShowMLFile(version, part):
+  return readUnfoldingMLFile("formatter-neural-show", version, part)
+
+def hasUnfoldingBookMLFile(version):
+  return hasUnfoldingMLFile("formatter-neural", version)
+
+def hasUnfoldingShowMLFile(version):
+  return hasUnfoldingMLFile("formatter-neural-show", version)
+
+def unfoldedAgesPerCharacter(unfolding): # list with the ages every character is unfolded with
+  counts = np.bincount(unfolding["charIdx"], minlength=unfolding["static"].shape[0])
+  return np.split(unfolding["ages"], np.cumsum(counts)[:-1])
+
+def selectUnfoldedCharacters(unfolding, chars): # the unfolding restricted to the given characters (sorted)
+  chars = np.asarray(chars, dtype=np.int64)
+  position = np.full(unfolding["static"].shape[0], -1, dtype=np.int64)
+  position[chars] = np.arange(chars.size)
+  samples = np.flatnonzero(position[unfolding["charIdx"]] >= 0)
+  static = unfolding["static"][chars] if scipy.sparse.issparse(unfolding["static"]) else np.asarray(unfolding["static"][chars])
+  labels = None if unfolding["labels"] is None else unfolding["labels"][samples]
+  return dict(unfolding, static=static, charIdx=position[unfolding["charIdx"][samples]], ages=unfolding["ages"][samples], labels=labels)
+
+def numUnfoldedSamples(unfolding):
+  return unfolding["charIdx"].size
+
+def unfoldedAgeColumns(unfolding, samples=None): # column of the age one-hot of the given (default: all) unfolded samples
+  # offset + age, not relative to the minimum age, like createSingleUnfolded in workers/common/utils.js
+  ages = unfolding["ages"] if samples is None else unfolding["ages"][samples]
+  return unfolding["offset"] + ages
+
+def createUnfoldedBatch(unfolding, samples): # dense data of the given unfolded samples, i.e. static row + age one-hot
+  static = unfolding["static"]
+  chars = unfolding["charIdx"][samples]
+  batch = static[chars].toarray() if scipy.sparse.issparse(static) else np.array(static[chars], dtype=np.float32)
+  batch[np.arange(batch.shape[0]), unfoldedAgeColumns(unfolding, samples)] = 1.0
+  return batch
+
+
+
+def iterateUnfoldedBatches(unfolding, batchSize=32, samples=None, shuffle=False, loop=False, withLabels=False):
+  # like iterateDenseBatches, but for unfolded samples
+  samples = np.arange(numUnfoldedSamples(unfolding)) if samples is None else np.asarray(samples)
+  while True:
+    order = np.random.permutation(samples) if shuffle else samples
+    for i in range(0, order.size, batchSize):
+      batchSamples = order[i:i + batchSize]
+      batch = createUnfoldedBatch(unfolding, batchSamples)
+      yield (batch, unfolding["labels"][batchSamples]) if withLabels else batch
+    if not loop:
+      return
+
+def fitUnfoldedModel(model, unfolding, epochs, batchSize, validationSplit=0.0):
+  # like fitModel; as the samples are not shuffled on disk, a random (but fixed) part of them is used for validation
+  order = np.random.permutation(numUnfoldedSamples(unfolding))
+  numTrain = int(order.size*(1.0 - validationSplit))
+  trainSamples, validationSamples = order[:numTrain], order[numTrain:]
+  validation = iterateUnfoldedBatches(unfolding, batchSize, validationSamples, loop=True, withLabels=True) if validationSamples.size > 0 else None
+  return fitGenerator(model, iterateUnfoldedBatches(unfolding, batchSize, trainSamples, shuffle=True, loop=True, withLabels=True), numBatches(trainSamples.size, batchSize), epochs, validation, numBatches(validationSamples.size, batchSize))
+
+def predictUnfoldedModel(model, unfolding, batchSize=256): # predictions for all unfolded samples, character by character
+  return np.concatenate([model.predict_on_batch(batch) for batch in iterateUnfoldedBatches(unfolding, batchSize)])
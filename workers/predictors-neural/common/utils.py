@@ -32,14 +32,76 @@ def readFormattedBinaryMLByteArray(f):
   len, = struct.unpack("<i", f[4:8])
   return np.reshape(np.frombuffer(f[8:], dtype=np.float32), [num, len])
 
-def readFormattedBinaryMLFile(worker, name):
+# Compressed files are decompressed chunk by chunk straight into a preallocated array. That array is backed by a
+# sidecar file next to the compressed one (<name>.sidecar.dat), so later runs can just memory-map it. The size and
+# modification time of the compressed file are stored in <name>.sidecar.json to detect stale sidecars.
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+def memmapFormattedBinaryMLFile(filename, mode="r"):
+  with open(filename, "rb") as f:
+    num, len = struct.unpack("<ii", f.read(8))
+  return np.memmap(filename, dtype=np.float32, mode=mode, offset=8, shape=(num, len))
+
+def gzFileStamp(filenameGz):
+  st = os.stat(filenameGz)
+  return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+def decompressFormattedBinaryMLFile(filenameGz, sidecar=None): # sidecar = None decompresses into memory only
+  decompressor = zlib.decompressobj()
+  header = b""
+  ret = None
+  pos = 0 # in bytes, within the data after the header
+  with open(filenameGz, "rb") as f:
+    while not decompressor.eof:
+      compressed = f.read(DECOMPRESS_CHUNK_SIZE)
+      chunk = decompressor.decompress(compressed) if compressed else decompressor.flush()
+      if ret is None:
+        header += chunk
+        if len(header) < 8:
+          if not compressed:
+            raise ValueError("truncated file: " + filenameGz)
+          continue
+        num, dims = struct.unpack("<ii", header[0:8])
+        if sidecar is None:
+          ret = np.empty((num, dims), dtype=np.float32)
+        else:
+          with open(sidecar, "wb") as out:
+            out.write(header[0:8])
+          ret = np.memmap(sidecar, dtype=np.float32, mode="r+", offset=8, shape=(num, dims))
+        view = ret.reshape(-1).view(np.uint8)
+        chunk = header[8:]
+      view[pos:pos + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+      pos += len(chunk)
+      if not compressed:
+        break
+  if ret is None or pos != view.size:
+    raise ValueError("truncated file: " + filenameGz)
+  return ret
+
+def readFormattedBinaryMLFile(worker, name, useSidecar=True):
   filename = os.path.join(dirname, "../../" + worker + "/output/" + name + ".dat")
   if os.path.isfile(filename):
-    with open(filename, "rb") as f:
-      return readFormattedBinaryMLByteArray(f.read())
-  else:
-    with open(filename + ".gz", "rb") as f:
-      return readFormattedBinaryMLByteArray(zlib.decompress(f.read()))
+    return memmapFormattedBinaryMLFile(filename)
+  filenameGz = filename + ".gz"
+  if not useSidecar:
+    return decompressFormattedBinaryMLFile(filenameGz)
+  sidecar = os.path.join(dirname, "../../" + worker + "/output/" + name + ".sidecar.dat")
+  stamp = gzFileStamp(filenameGz)
+  try:
+    with open(sidecar[:-4] + ".json", "r") as f:
+      if json.load(f) == stamp and os.path.isfile(sidecar):
+        return memmapFormattedBinaryMLFile(sidecar)
+  except (IOError, ValueError):
+    pass
+  try:
+    tmp = sidecar + ".tmp"
+    decompressFormattedBinaryMLFile(filenameGz, tmp).flush()
+    os.replace(tmp, sidecar)
+    with open(sidecar[:-4] + ".json", "w") as f:
+      json.dump(stamp, f)
+    return memmapFormattedBinaryMLFile(sidecar)
+  except (IOError, OSError): # e.g. a read-only output directory, fall back to decompressing into memory
+    return decompressFormattedBinaryMLFile(filenameGz)
 
 def readFormattedBinaryBookMLFile(name):
   return readFormattedBinaryMLFile("formatter-neural", name)
@@ -49,6 +111,13 @@ def readFormattedBinaryShowMLFile(name):
 
 
 
+def readJSON(name): # counterpart of writeJSON, None if the file doesn't exist (yet)
+  filename = os.path.join(dirnameMain, "output/" + name + ".json")
+  if not os.path.isfile(filename):
+    return None
+  with open(filename, "r") as f:
+    return json.load(f)
+
 def writeJSON(name, obj, pretty=False):
   with open(os.path.join(dirnameMain, "output/" + name + ".json"), "w") as f:
     json.dump(obj, f, indent=4 if pretty else None)
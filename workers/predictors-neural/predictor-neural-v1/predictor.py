@@ -5,28 +5,33 @@ import sys
 import os
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-import keras
 import numpy as np
-from keras.models import Sequential, load_model
-from keras.layers import Activation, Dropout, Flatten, Dense
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../common"))
 from utils import *
 from config import *
+from npmodel import *
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../predictors-common"))
+from instrumentation import fromEnvironment
 
 
 
+instrumentation = fromEnvironment() # per-stage timings and memory, only written to output/run-report.json if PREDICTORS_REPORT is set
+
 # read character training and prediction data
-charsTrain = readBookMLDataFile("chars-to-train")
-charsPredict = readBookMLDataFile("chars-to-predict")
-dataPredict = readFormattedBinaryBookMLFile("v1-data-predict")
-dataTrain = readFormattedBinaryBookMLFile("v1-data-train")
-labelsTrain = readFormattedBinaryBookMLFile("v1-labels-train")
+with instrumentation.stage("readData"):
+  charsTrain = readBookMLDataFile("chars-to-train")
+  charsPredict = readBookMLDataFile("chars-to-predict")
+  dataPredict = readFormattedBinaryBookMLFile("v1-data-predict")
+  dataTrain = readFormattedBinaryBookMLFile("v1-data-train")
+  labelsTrain = readFormattedBinaryBookMLFile("v1-labels-train")
 
 
 
 if False:
-  # build the model
+  # build the model (Keras is only needed for training, predictions use the exported NumPy version of the model)
+  from keras.models import Sequential
+  from keras.layers import Dropout, Dense
   model = Sequential()
   model.add(Dense(250, activation='relu'))
   model.add(Dropout(0.5))
@@ -36,13 +41,20 @@ if False:
   model.compile(optimizer='rmsprop', loss='binary_crossentropy', metrics=['accuracy'])
 
   # train the model
-  model.fit(dataTrain, labelsTrain, epochs=200, batch_size=16)
+  with instrumentation.stage("train"):
+    model.fit(dataTrain, labelsTrain, epochs=200, batch_size=16)
   model.save(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
+  exportModel(model, os.path.join(dirnameMain, 'models/got-predictor-model.npz'))
 
 else:
   # predict ages for other characters
-  model = load_model(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
-  predictionsAge = np.argmax(model.predict(dataPredict), 1)
+  with instrumentation.stage("loadModel"):
+    model = loadPredictorModel(os.path.join(dirnameMain, 'models'))
+  with instrumentation.stage("predict"):
+    predictionsAge = np.argmax(model.predict(dataPredict), 1)
+
+  with instrumentation.stage("writeOutput"):
+    predictionsRelativeToCurrent = list(map(lambda x: int(x[0]["birth"] + x[1] - GOT_CURRENT_YEAR_BOOK), list(zip(charsPredict, predictionsAge))))
+    writeJSON("predictions", dict(zip(map(lambda x: x["name"], charsPredict), predictionsRelativeToCurrent)))
 
-  predictionsRelativeToCurrent = list(map(lambda x: int(x[0]["birth"] + x[1] - GOT_CURRENT_YEAR_BOOK), list(zip(charsPredict, predictionsAge))))
-  writeJSON("predictions", dict(zip(map(lambda x: x["name"], charsPredict), predictionsRelativeToCurrent)))
+instrumentation.write(os.path.join(dirnameMain, 'output/run-report.json'))
@@ -3,50 +3,93 @@
 
 import sys
 import os
+import argparse
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-import keras
 import numpy as np
-from keras.models import Sequential, load_model
-from keras.layers import Activation, Dropout, Flatten, Dense
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../common"))
 from utils import *
 from config import *
+from npmodel import *
+from sparse import *
+from unfolding import *
+from factorized import *
+from architectures import *
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../predictors-common"))
+from instrumentation import fromEnvironment
+from incremental import arraysHash, itemHashes, loadState, saveState, changedItems, mergeByName
+from columnar import writeColumnar
 
 
 
-# read character training and prediction data
-charsTrain = readBookMLDataFile("chars-to-train")
-charsPredict = readBookMLDataFile("chars-to-predict")
-dataPredict = readFormattedBinaryBookMLFile("v2-data-predict")
-dataTrain = readFormattedBinaryBookMLFile("v2-data-train")
-labelsTrain = readFormattedBinaryBookMLFile("v2-labels-train")
+parser = argparse.ArgumentParser()
+parser.add_argument("--train", action="store_true", help="train the model (and export it) instead of predicting")
+parser.add_argument("--config", help="with --train, a JSON file with settings replacing those of the architecture, e.g. the best.json of a sweep (see ../sweep/sweep.py)")
+parser.add_argument("--incremental", action="store_true", help="only predict characters whose data changed since the last run (with the same model) and merge them into the existing predictions")
+parser.add_argument("--output-format", choices=["json", "columnar", "both"], default="json", help="write the JSON predictions (default), the compact columnar output/predictions.npz (columnar.py exports it to JSON) or both")
+args = parser.parse_args()
 
+instrumentation = fromEnvironment() # per-stage timings and memory, only written to output/run-report.json if PREDICTORS_REPORT is set
 
+# read character training and prediction data (if the formatter wrote static data using --static, it's unfolded on the fly)
+with instrumentation.stage("readData"):
+  charsTrain = readBookMLDataFile("chars-to-train")
+  charsPredict = readBookMLDataFile("chars-to-predict")
+  unfolded = hasUnfoldingBookMLFile("v2")
+  if not unfolded:
+    dataPredict = readFormattedBookMLFile("v2-data-predict")
+    dataTrain = readFormattedBookMLFile("v2-data-train")
+    labelsTrain = readFormattedBinaryBookMLFile("v2-labels-train")
 
-if False:
-  # build the model
-  model = Sequential()
-  model.add(Dense(500, activation='relu'))
-  model.add(Dropout(0.8))
-  model.add(Dense(250, activation='relu'))
-  model.add(Dropout(0.8))
-  model.add(Dense(100, activation='relu'))
-  model.add(Dropout(0.8))
-  model.add(Dense(1, activation='sigmoid'))
-  model.compile(optimizer='rmsprop', loss='binary_crossentropy', metrics=['accuracy'])
+
+
+if args.train:
+  # build the model (Keras is only needed for training, predictions use the exported NumPy version of the model)
+  config = architectureConfig("v2", readConfigFile(args.config) if args.config else None)
+  if "seed" in config:
+    seedEverything(config["seed"])
+  model = buildModel(config)
 
   # train the model
-  model.fit(dataTrain, labelsTrain, epochs=5, batch_size=32, validation_split=0.2)
+  with instrumentation.stage("train"):
+    if unfolded:
+      fitUnfoldedModel(model, readUnfoldingBookMLFile("v2", "train"), epochs=config["epochs"], batchSize=config["batchSize"], validationSplit=config["validationSplit"])
+    else:
+      fitModel(model, dataTrain, labelsTrain, epochs=config["epochs"], batchSize=config["batchSize"], validationSplit=config["validationSplit"])
   model.save(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
+  exportModel(model, os.path.join(dirnameMain, 'models/got-predictor-model.npz'))
 
 else:
   # predict ages for other characters
-  model = load_model(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
-  predictionsPLOD = np.array(np.array_split(model.predict(dataPredict).flatten(), len(charsPredict))).tolist()
-  predictionsDict = dict(zip(map(lambda x: x["name"], charsPredict), predictionsPLOD))
-  writeJSON("predictions", predictionsDict, True)
-  for k, v in predictionsDict.items():
-    predictionsDict[k] = 1.0 - v[0]
-  writeJSON("predictions-plod", predictionsDict, True)
+  stateFile = os.path.join(dirnameMain, 'output/predictions.state.json') # content hashes of the characters' feature rows
+  with instrumentation.stage("loadModel"):
+    model = loadPredictorModel(os.path.join(dirnameMain, 'models'))
+  # with --incremental, characters whose feature rows didn't change since the last prediction with this model are skipped
+  with instrumentation.stage("hashes"):
+    names = list(map(lambda x: x["name"], charsPredict))
+    unfoldingPredict = readUnfoldingBookMLFile("v2", "predict") if unfolded else None
+    hashes = itemHashes(unfoldingPredict["static"], len(names), unfoldedAgesPerCharacter(unfoldingPredict)) if unfolded else itemHashes(dataPredict, len(names))
+    modelKey = arraysHash([a for layer in denseLayersOf(model) for a in layer])
+    predictionsPrevious = (readJSON("predictions") or {}) if args.incremental else {}
+    predictItems = changedItems(loadState(stateFile) if args.incremental else None, modelKey, names, hashes, predictionsPrevious)
+  # for unfolded data, the static part of the first layer is only computed once per character instead of once per year
+  with instrumentation.stage("predict"):
+    predictions = np.zeros((0, 1))
+    if predictItems.size > 0:
+      predictions = predictUnfoldedFactorized(model, selectUnfoldedCharacters(unfoldingPredict, predictItems)) if unfolded else predictModel(model, selectItemRows(dataPredict, predictItems, len(names)))
+  instrumentation.record("predictedCharacters", int(predictItems.size))
+  with instrumentation.stage("writeOutput"):
+    predictionsPLOD = np.array(np.array_split(predictions.flatten(), predictItems.size)).tolist() if predictItems.size > 0 else []
+    predictionsDict = mergeByName(names, dict(zip([names[i] for i in predictItems], predictionsPLOD)), predictionsPrevious)
+    if args.output_format in ["columnar", "both"]: # one row of float32 values per character, plus their PLOD
+      predictionsMatrix = np.array(list(predictionsDict.values()), dtype=np.float32)
+      writeColumnar(os.path.join(dirnameMain, 'output/predictions.npz'), names, {"predictions": predictionsMatrix, "plod": 1.0 - predictionsMatrix[:, 0]})
+    if args.output_format in ["json", "both"]:
+      writeJSON("predictions", predictionsDict, True)
+      for k, v in predictionsDict.items():
+        predictionsDict[k] = 1.0 - v[0]
+      writeJSON("predictions-plod", predictionsDict, True)
+      saveState(stateFile, modelKey, names, hashes) # --incremental merges into the JSON predictions
+
+instrumentation.write(os.path.join(dirnameMain, 'output/run-report.json'))
@@ -5,28 +5,33 @@ import sys
 import os
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-import keras
 import numpy as np
-from keras.models import Sequential, load_model
-from keras.layers import Activation, Dropout, Flatten, Dense
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../common"))
 from utils import *
 from config import *
+from npmodel import *
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../predictors-common"))
+from instrumentation import fromEnvironment
 
 
 
+instrumentation = fromEnvironment() # per-stage timings and memory, only written to output/run-report.json if PREDICTORS_REPORT is set
+
 # read character training and prediction data
-charsTrain = readBookMLDataFile("chars-to-train")
-charsPredict = readBookMLDataFile("chars-to-predict")
-dataPredict = readFormattedBinaryBookMLFile("v3-data-predict")
-dataTrain = readFormattedBinaryBookMLFile("v3-data-train")
-labelsTrain = readFormattedBinaryBookMLFile("v3-labels-train")
+with instrumentation.stage("readData"):
+  charsTrain = readBookMLDataFile("chars-to-train")
+  charsPredict = readBookMLDataFile("chars-to-predict")
+  dataPredict = readFormattedBinaryBookMLFile("v3-data-predict")
+  dataTrain = readFormattedBinaryBookMLFile("v3-data-train")
+  labelsTrain = readFormattedBinaryBookMLFile("v3-labels-train")
 
 
 
 if False:
-  # build the model
+  # build the model (Keras is only needed for training, predictions use the exported NumPy version of the model)
+  from keras.models import Sequential
+  from keras.layers import Dropout, Dense
   model = Sequential()
   model.add(Dense(750, activation='relu'))
   model.add(Dropout(0.9))
@@ -40,11 +45,18 @@ if False:
   model.compile(optimizer='rmsprop', loss='binary_crossentropy', metrics=['accuracy'])
 
   # train the model
-  model.fit(dataTrain, labelsTrain, epochs=5, batch_size=32)
+  with instrumentation.stage("train"):
+    model.fit(dataTrain, labelsTrain, epochs=5, batch_size=32)
   model.save(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
+  exportModel(model, os.path.join(dirnameMain, 'models/got-predictor-model.npz'))
 
 else:
   # predict ages for other characters
-  model = load_model(os.path.join(dirnameMain, 'models/got-predictor-model.h5'))
-  predictionsPLOD = model.predict(dataPredict).tolist()
-  writeJSON("predictions", dict(zip(map(lambda x: x["name"], charsPredict), predictionsPLOD)))
+  with instrumentation.stage("loadModel"):
+    model = loadPredictorModel(os.path.join(dirnameMain, 'models'))
+  with instrumentation.stage("predict"):
+    predictionsPLOD = model.predict(dataPredict).tolist()
+  with instrumentation.stage("writeOutput"):
+    writeJSON("predictions", dict(zip(map(lambda x: x["name"], charsPredict), predictionsPLOD)))
+
+instrumentation.write(os.path.join(dirnameMain, 'output/run-report.json'))
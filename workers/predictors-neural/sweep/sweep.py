@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import itertools
+import traceback
+import multiprocessing
+
+
+
+# Hyperparameter and seed sweep for the neural predictors. A search space (a JSON file with a list of candidate values
+# per setting of common/architectures.py, e.g. {"layers": [[500, 250, 100], [250, 100]], "dropout": [0.5, 0.8]}) is
+# searched on a grid or randomly, every config with every seed. The training data is loaded once by the sweep process
+# and the trials are forked from it, so they share it read-only instead of loading it again. Every trial is a process
+# of its own, limited to --threads threads of the math libraries, and --workers of them run at once. The results of a
+# trial (validation accuracy, wall time, memory) and its exported model are cached by a hash of its config and of the
+# training data files, so rerunning a sweep only trains the new configs.
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+workersDir = os.path.join(dirname, "../..")
+
+# sweep target -> formatter worker, data version and predictor directory
+TARGETS = {
+  "v2": {"worker": "formatter-neural", "version": "v2", "predictor": "predictor-neural-v2"},
+  "show-v1": {"worker": "formatter-neural-show", "version": "v1", "predictor": "predictor-neural-show-v1"},
+}
+
+def availableCores():
+  try:
+    return len(os.sched_getaffinity(0))
+  except AttributeError:
+    return os.cpu_count() or 1
+
+def limitThreads(threads): # has to happen before NumPy or TensorFlow are loaded, the trials inherit the environment
+  for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]:
+    os.environ[var] = str(threads)
+  os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+  os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+
+parser = argparse.ArgumentParser(description="Train the architectures of a neural predictor with different hyperparameters and seeds in parallel.")
+parser.add_argument("target", choices=list(TARGETS.keys()))
+parser.add_argument("--space", help="JSON file with a list of candidate values per setting (default: only the predictor's own config)")
+parser.add_argument("--search", choices=["grid", "random"], default="grid", help="try every combination of the candidate values or --trials random ones (default: %(default)s)")
+parser.add_argument("--trials", type=int, default=10, help="number of configs drawn by the random search (default: %(default)s)")
+parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="every config is trained with each of these seeds (default: %(default)s)")
+parser.add_argument("--threads", type=int, default=1, help="threads per trial (default: %(default)s)")
+parser.add_argument("--workers", type=int, default=None, help="trials running at once (default: available cores / threads)")
+parser.add_argument("--random-seed", type=int, default=0, help="seed of the random search")
+parser.add_argument("--no-cache", action="store_true", help="train every trial again, even if its results are cached")
+parser.add_argument("--install", action="store_true", help="copy the model of the best trial to the predictor's models directory")
+args = parser.parse_args()
+limitThreads(args.threads)
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(dirname, "../common"))
+from utils import readFormattedBinaryMLFile, gzFileStamp
+from sparse import hasFormattedSparseMLFile, readFormattedSparseMLFile, fitModel
+from unfolding import hasUnfoldingMLFile, readUnfoldingMLFile, fitUnfoldedModel
+from npmodel import exportModel
+from architectures import architectureConfig, buildModel, seedEverything, historyMetric
+sys.path.insert(0, os.path.join(dirname, "../../predictors-common"))
+from instrumentation import Instrumentation
+
+
+
+def loadTrainingData(target): # the data the predictor trains on, read the same way the predictor reads it
+  worker, version = TARGETS[target]["worker"], TARGETS[target]["version"]
+  if hasUnfoldingMLFile(worker, version):
+    return {"unfolding": readUnfoldingMLFile(worker, version, "train")}
+  name = version + "-data-train"
+  data = readFormattedSparseMLFile(worker, name) if hasFormattedSparseMLFile(worker, name) else readFormattedBinaryMLFile(worker, name)
+  return {"data": data, "labels": readFormattedBinaryMLFile(worker, version + "-labels-train")}
+
+def dataStamp(target): # size and modification time of the formatter outputs the trials train on
+  worker, version = TARGETS[target]["worker"], TARGETS[target]["version"]
+  outputDir = os.path.join(workersDir, worker, "output")
+  files = sorted(f for f in os.listdir(outputDir) if f.startswith(version + "-") and "-predict" not in f and ".sidecar." not in f and not f.endswith(".tmp"))
+  return {f: gzFileStamp(os.path.join(outputDir, f)) for f in files}
+
+def trialKey(target, config, stamp):
+  h = hashlib.sha1(json.dumps({"target": target, "config": config, "data": stamp}, sort_keys=True).encode("utf-8"))
+  return h.hexdigest()[:16]
+
+def searchConfigs(base, space, search, numTrials, rng): # configs of the grid resp. random search, without seeds
+  keys = sorted(space.keys())
+  combinations = list(itertools.product(*[range(len(space[k])) for k in keys]))
+  if search == "random" and numTrials < len(combinations):
+    combinations = sorted(rng.sample(combinations, numTrials))
+  return [dict(base, **{k: space[k][i] for k, i in zip(keys, combination)}) for combination in combinations]
+
+
+
+# the training data of the trials, set by the sweep process before the trials are forked
+trainingData = None
+
+def runTrial(trial): # trains one config in a forked process, returns its results
+  logFile = trial["files"]["log"]
+  with open(logFile, "w") as log: # Keras' progress output of parallel trials would be unreadable
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+  config = trial["config"]
+  instrumentation = Instrumentation(enabled=True)
+  try:
+    with instrumentation.stage("build"):
+      seedEverything(config["seed"])
+      model = buildModel(config)
+    with instrumentation.stage("train"):
+      if "unfolding" in trainingData:
+        history = fitUnfoldedModel(model, trainingData["unfolding"], epochs=config["epochs"], batchSize=config["batchSize"], validationSplit=config["validationSplit"])
+      else:
+        history = fitModel(model, trainingData["data"], trainingData["labels"], epochs=config["epochs"], batchSize=config["batchSize"], validationSplit=config["validationSplit"])
+    exportModel(model, trial["files"]["model"])
+    report = instrumentation.report()
+    train = report["stages"][-1]
+    return dict(trial, status="ok", **{
+      "validationAccuracy": historyMetric(history, "val_accuracy"),
+      "validationLoss": historyMetric(history, "val_loss"),
+      "accuracy": historyMetric(history, "accuracy"),
+      "loss": historyMetric(history, "loss"),
+      "wallSeconds": report["wallSeconds"],
+      "trainSeconds": train["wallSeconds"],
+      "cpuSeconds": report["cpuSeconds"],
+      "peakRssBytes": report["peakRssBytes"],
+      "peakRssIncreaseBytes": sum(s["peakRssIncreaseBytes"] for s in report["stages"]),
+    })
+  except Exception:
+    traceback.print_exc() # into the trial's log
+    return dict(trial, status="failed", error=traceback.format_exc())
+  finally:
+    sys.stdout.flush() # the pool ends its processes without flushing
+    sys.stderr.flush()
+
+def loadCachedTrial(trial):
+  try:
+    with open(trial["files"]["result"], "r") as f:
+      result = json.load(f)
+  except (IOError, OSError, ValueError):
+    return None
+  return dict(result, cached=True) if result.get("status") == "ok" and os.path.isfile(trial["files"]["model"]) else None
+
+def storeTrial(result):
+  with open(result["files"]["result"] + ".tmp", "w") as f:
+    json.dump(result, f, indent=2)
+  os.replace(result["files"]["result"] + ".tmp", result["files"]["result"])
+
+def rankConfigs(results): # results grouped by config (over the seeds), best mean validation accuracy first
+  groups = {}
+  for r in results:
+    if r["status"] == "ok":
+      config = dict(r["config"])
+      del config["seed"]
+      groups.setdefault(json.dumps(config, sort_keys=True), []).append(r)
+  ranking = []
+  for config, trials in groups.items():
+    accuracies = [t["validationAccuracy"] if t["validationAccuracy"] is not None else t["accuracy"] for t in trials]
+    best = trials[int(np.argmax(accuracies))]
+    ranking.append({
+      "config": json.loads(config),
+      "seeds": [t["config"]["seed"] for t in trials],
+      "meanValidationAccuracy": float(np.mean(accuracies)),
+      "minValidationAccuracy": float(np.min(accuracies)),
+      "maxValidationAccuracy": float(np.max(accuracies)),
+      "meanTrainSeconds": float(np.mean([t["trainSeconds"] for t in trials])),
+      "maxPeakRssBytes": max(t["peakRssBytes"] for t in trials),
+      "bestTrial": best["key"],
+    })
+  return sorted(ranking, key=lambda r: -r["meanValidationAccuracy"])
+
+
+
+if __name__ == "__main__":
+  base = architectureConfig(args.target)
+  space = {}
+  if args.space:
+    with open(args.space, "r") as f:
+      space = json.load(f)
+  for k in space:
+    if k not in base and k != "seed":
+      parser.error("unknown setting '%s', choose from: %s" % (k, ", ".join(base.keys())))
+  if "seed" in space: # seeds are given by --seeds
+    args.seeds = space.pop("seed")
+
+  outputDir = os.path.join(dirname, "output", args.target)
+  trialsDir = os.path.join(outputDir, "trials")
+  os.makedirs(trialsDir, exist_ok=True)
+  stamp = dataStamp(args.target)
+  trials = []
+  for searchConfig in searchConfigs(base, space, args.search, args.trials, random.Random(args.random_seed)):
+    for seed in args.seeds:
+      config = dict(searchConfig, seed=seed)
+      key = trialKey(args.target, config, stamp)
+      files = {name: os.path.join(trialsDir, key + ext) for name, ext in [("result", ".json"), ("model", ".npz"), ("log", ".log")]}
+      trials.append({"key": key, "config": config, "files": files})
+
+  results = []
+  pending = []
+  for trial in trials:
+    cached = None if args.no_cache else loadCachedTrial(trial)
+    if cached is not None:
+      results.append(cached)
+    else:
+      pending.append(trial)
+  workers = max(1, min(args.workers or availableCores() // max(args.threads, 1), len(pending) or 1))
+  print("%d trials, %d cached, training %d with %d worker(s) of %d thread(s)" % (len(trials), len(results), len(pending), workers, args.threads))
+
+  start = time.time()
+  if pending:
+    trainingData = loadTrainingData(args.target) # before forking, so that the trials share it
+    context = multiprocessing.get_context("fork")
+    with context.Pool(workers, maxtasksperchild=1) as pool: # a fresh process per trial, nothing leaks between trials
+      for result in pool.imap_unordered(runTrial, pending):
+        if result["status"] == "ok":
+          storeTrial(result)
+          print("%s: validation accuracy %.4f after %.1fs, %.0f MB peak RSS" % (result["key"], result["validationAccuracy"] or float("nan"), result["trainSeconds"], result["peakRssBytes"]/1e6))
+        else:
+          print("%s failed, see %s" % (result["key"], result["files"]["log"]))
+        results.append(result)
+
+  ranking = rankConfigs(results)
+  report = {"target": args.target, "search": args.search, "space": space, "seeds": args.seeds, "threads": args.threads, "workers": workers, "seconds": time.time() - start, "data": stamp, "ranking": ranking, "trials": results}
+  with open(os.path.join(outputDir, "sweep-report.json"), "w") as f:
+    json.dump(report, f, indent=2)
+  if ranking:
+    best = [r for r in results if r["key"] == ranking[0]["bestTrial"]][0]
+    with open(os.path.join(outputDir, "best.json"), "w") as f: # for the predictor's --train --config
+      json.dump(best["config"], f, indent=2)
+    for r in ranking[:10]:
+      print("%.4f (%.4f-%.4f) %.1fs %s" % (r["meanValidationAccuracy"], r["minValidationAccuracy"], r["maxValidationAccuracy"], r["meanTrainSeconds"], json.dumps(r["config"], sort_keys=True)))
+    if args.install:
+      modelsDir = os.path.join(dirname, "..", TARGETS[args.target]["predictor"], "models")
+      shutil.copyfile(best["files"]["model"], os.path.join(modelsDir, "got-predictor-model.npz"))
+      print("installed the model of trial %s" % best["key"])
+  sys.exit(0 if all(r["status"] == "ok" for r in results) else 1)
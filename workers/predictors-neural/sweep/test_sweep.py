@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+
+
+# Runs a single trial on tiny sparse resp. unfolded training data, forked from a process that has the data loaded like
+# the sweep does. That happens in a child process, so that neither the sweep's arguments nor TensorFlow end up in the
+# test process.
+TRIAL = """
+import os, sys, json, multiprocessing
+import numpy as np, scipy.sparse
+kind, tmp = sys.argv[1], sys.argv[2]
+sys.argv = ["sweep.py", "v2"]
+import sweep
+from unfolding import unfoldingFromMeta
+if kind == "sparse":
+  rng = np.random.default_rng(0)
+  sweep.trainingData = {"data": scipy.sparse.random(40, 12, density=0.2, format="csr", random_state=0, dtype=np.float32), "labels": (rng.random((40, 1)) < 0.5).astype(np.float32)}
+else:
+  with open(os.path.join(sweep.dirname, "../common/fixtures/unfolding.json"), "r") as f:
+    fixture = json.load(f)
+  sweep.trainingData = {"unfolding": unfoldingFromMeta(fixture["unfolding"], "train", scipy.sparse.csr_matrix(np.array(fixture["static"]["train"], dtype=np.float32)))}
+config = sweep.architectureConfig("v2", {"layers": [8], "dropout": 0.5, "epochs": 1, "batchSize": 4, "validationSplit": 0.25, "seed": 0})
+files = {name: os.path.join(tmp, kind + ext) for name, ext in [("result", ".json"), ("model", ".npz"), ("log", ".log")]}
+with multiprocessing.get_context("fork").Pool(1, maxtasksperchild=1) as pool:
+  result = pool.apply(sweep.runTrial, ({"key": kind, "config": config, "files": files},))
+print(json.dumps(result))
+"""
+
+class SweepTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def runTrial(self, kind):
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+    script = os.path.join(self.tmp, "trial.py") # a file rather than -c, the neural utils need __main__.__file__
+    with open(script, "w") as f:
+      f.write("import sys\nsys.path.insert(0, %r)\n" % dirname + TRIAL)
+    out = subprocess.run([sys.executable, script, kind, self.tmp], cwd=dirname, env=env, stdout=subprocess.PIPE, check=True, timeout=600)
+    result = json.loads(out.stdout.decode("utf-8").strip().splitlines()[-1])
+    self.assertEqual(result["status"], "ok", result.get("error"))
+    self.assertIsNotNone(result["validationAccuracy"])
+    self.assertTrue(os.path.isfile(result["files"]["model"]))
+
+  def test_sparse_trial(self):
+    self.runTrial("sparse")
+
+  def test_unfolded_trial(self):
+    self.runTrial("unfolded")
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+
+# Runs the predictor workers as a dependency-aware job graph. Every job is a separate process; a job is only
+# started once all of its dependencies succeeded and enough of the core budget is free, so that the cores used by
+# all running jobs (e.g. chains x Bayesian jobs) never exceed the available ones.
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+workersDir = os.path.join(dirname, "..")
+
+BAYESIAN_CHAINS = 2 # default, --chains in --bayesian-args replaces it
+
+# name -> cwd (relative to workers/), command, requested cores, names of the jobs that have to finish first and whether
+# the job supports --incremental; Bayesian jobs request a core per chain
+JOBS = {
+  "predictor-bayesean-book": {"cwd": "predictors-bayesian/predictor-bayesean-book", "cmd": [sys.executable, "predictor.py"], "cores": BAYESIAN_CHAINS, "deps": [], "bayesian": True, "incremental": True},
+  "predictor-bayesean-show": {"cwd": "predictors-bayesian/predictor-bayesean-show", "cmd": [sys.executable, "predictor.py"], "cores": BAYESIAN_CHAINS, "deps": [], "bayesian": True, "incremental": True},
+  "postprocessor-bayesean-book": {"cwd": "postprocessor-bayesean-book", "cmd": ["node", "index.js"], "cores": 1, "deps": ["predictor-bayesean-book"]},
+  "postprocessor-bayesean-show": {"cwd": "postprocessor-bayesean-show", "cmd": ["node", "index.js"], "cores": 1, "deps": ["predictor-bayesean-show"]},
+  "predictor-neural-v2": {"cwd": "predictors-neural/predictor-neural-v2", "cmd": [sys.executable, "predictor.py"], "cores": 1, "deps": [], "incremental": True},
+  "predictor-neural-show-v1": {"cwd": "predictors-neural/predictor-neural-show-v1", "cmd": [sys.executable, "predictor.py"], "cores": 1, "deps": [], "incremental": True},
+}
+
+def availableCores():
+  try:
+    return len(os.sched_getaffinity(0))
+  except AttributeError:
+    return os.cpu_count() or 1
+
+def withDependencies(names): # the selected jobs plus everything they (transitively) depend on
+  ret = []
+  def add(name):
+    if name in ret:
+      return
+    for dep in JOBS[name]["deps"]:
+      add(dep)
+    ret.append(name)
+  for name in names:
+    add(name)
+  return ret
+
+def splitBayesianArgs(argString): # (number of chains, cores given, the other arguments) of --bayesian-args
+  parser = argparse.ArgumentParser(add_help=False)
+  parser.add_argument("--chains", type=int, default=BAYESIAN_CHAINS)
+  parser.add_argument("--cores", type=int, default=None)
+  known, rest = parser.parse_known_args(argString.split())
+  return known.chains, known.cores, rest
+
+def jobCommand(name, cores, extraBayesianArgs):
+  # Bayesian jobs sample their chains on the job's cores, i.e. one after another if there are fewer cores than chains
+  job = JOBS[name]
+  cmd = list(job["cmd"])
+  if job.get("bayesian"):
+    cmd += ["--chains", str(job["cores"]), "--cores", str(cores)] + extraBayesianArgs
+  return cmd
+
+def jobEnv(name, cores): # limit the math libraries to the job's budget, Bayesian chains are one process per core already
+  threads = "1" if JOBS[name].get("bayesian") else str(cores)
+  env = dict(os.environ)
+  for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]:
+    env[var] = threads
+  env["TF_NUM_INTEROP_THREADS"] = "1"
+  return env
+
+def runJob(name, cores, extraBayesianArgs, logDir):
+  start = time.time()
+  with open(os.path.join(logDir, name + ".log"), "w") as log:
+    try:
+      returncode = subprocess.call(jobCommand(name, cores, extraBayesianArgs), cwd=os.path.join(workersDir, JOBS[name]["cwd"]), env=jobEnv(name, cores), stdout=log, stderr=subprocess.STDOUT)
+    except OSError as e: # e.g. a missing interpreter or working directory, the job fails like one exiting with an error
+      log.write("failed to start: %s\n" % e)
+      return {"status": "failed", "error": str(e), "cores": cores, "seconds": time.time() - start}
+  return {"status": "ok" if returncode == 0 else "failed", "returncode": returncode, "cores": cores, "seconds": time.time() - start}
+
+def runGraph(names, totalCores, extraBayesianArgs, logDir):
+  results = {}
+  pending = list(names)
+  running = {} # future -> job name
+  freeCores = totalCores
+  with ThreadPoolExecutor(max_workers=len(names) or 1) as pool:
+    while pending or running:
+      # skip jobs whose dependencies failed, start those whose dependencies are done as long as cores are left
+      for name in list(pending):
+        deps = JOBS[name]["deps"]
+        if any(results.get(d, {}).get("status") in ["failed", "skipped"] for d in deps):
+          results[name] = {"status": "skipped", "seconds": 0.0}
+          pending.remove(name)
+        elif all(results.get(d, {}).get("status") == "ok" for d in deps):
+          cores = min(JOBS[name]["cores"], totalCores)
+          if cores <= freeCores:
+            freeCores -= cores
+            print("starting %s on %d core(s)" % (name, cores))
+            running[pool.submit(runJob, name, cores, extraBayesianArgs, logDir)] = name
+            pending.remove(name)
+      if not running:
+        continue
+      done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+      for future in done:
+        name = running.pop(future)
+        results[name] = future.result()
+        freeCores += results[name]["cores"]
+        print("%s %s after %.1fs" % (name, results[name]["status"], results[name]["seconds"]))
+  return results
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run the predictor workers in parallel, respecting their dependencies and a core budget.")
+  parser.add_argument("jobs", nargs="*", metavar="JOB", help="jobs to run, including their dependencies (default: all)")
+  parser.add_argument("--cores", type=int, default=availableCores(), help="total core budget (default: %(default)s)")
+  parser.add_argument("--bayesian-args", default="", help="extra arguments for the Bayesian predictors, e.g. \"--inference advi\"")
+  parser.add_argument("--incremental", action="store_true", help="only let the predictors compute characters whose data changed since their last run")
+  args = parser.parse_args()
+  for name in args.jobs:
+    if name not in JOBS:
+      parser.error("unknown job '%s', choose from: %s" % (name, ", ".join(JOBS.keys())))
+  chains, bayesianCores, bayesianArgs = splitBayesianArgs(args.bayesian_args)
+  if bayesianCores is not None:
+    parser.error("--cores of the Bayesian predictors is set by the runner, use the runner's --cores instead")
+  if chains < 1:
+    parser.error("--chains of the Bayesian predictors has to be at least 1")
+
+  for job in JOBS.values():
+    if job.get("bayesian"):
+      job["cores"] = chains
+    if args.incremental and job.get("incremental"):
+      job["cmd"].append("--incremental")
+  names = withDependencies(args.jobs or list(JOBS.keys()))
+  logDir = os.path.join(dirname, "output/logs")
+  os.makedirs(logDir, exist_ok=True)
+  start = time.time()
+  results = runGraph(names, max(args.cores, 1), bayesianArgs, logDir)
+  report = {"cores": args.cores, "seconds": time.time() - start, "jobs": results}
+  with open(os.path.join(dirname, "output/runner-report.json"), "w") as f:
+    json.dump(report, f, indent=2)
+  sys.exit(0 if all(r["status"] == "ok" for r in results.values()) else 1)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import collections
+from concurrent.futures import Future
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import numpy as np
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(dirname, "../predictors-neural/common"))
+sys.path.insert(0, os.path.join(dirname, "../predictors-bayesian/common"))
+from npmodel import loadNumpyModel
+from survival import survival_function_means
+from tracecache import list_traces, load_trace, load_trace_settings
+
+
+
+# Local prediction service: loads the exported neural models and the most recent cached Bayesian traces once and
+# answers what-if queries for (hypothetical) characters via HTTP on localhost. Concurrent requests for the same model
+# are coalesced into micro-batches, so that there is just one forward pass or one trace matmul per batch.
+#
+#   POST /neural/<model>     {"features": [[...], ...]}                     -> {"predictions": [[...], ...]}
+#   POST /bayesian/<dataset> {"features": [[...] or {"attr": value}, ...]}  -> {"survivalFunctionMean": [[...], ...]}
+#   GET  /models, GET /stats
+
+NEURAL_MODELS = {
+  "book": "../predictors-neural/predictor-neural-v2/models/got-predictor-model.npz",
+  "show": "../predictors-neural/predictor-neural-show-v1/models/got-predictor-model.npz",
+}
+BAYESIAN_MODELS = { # trace cache directory and number of time slices to predict if the base hazard is the same for all of them
+  "book": {"cache": "../predictors-bayesian/predictor-bayesean-book/trace-cache", "numSlices": None},
+  "show": {"cache": "../predictors-bayesian/predictor-bayesean-show/trace-cache", "numSlices": 50},
+}
+INTERVAL_LENGTH = 1
+
+class MicroBatcher:
+  # collects the rows of concurrent requests for up to maxWait seconds (or maxBatchSize rows) and processes them
+  # with a single call of fn, which maps a rows x dims array to an array with one result row per input row
+  def __init__(self, fn, maxBatchSize=1024, maxWait=0.002):
+    self.fn = fn
+    self.maxBatchSize = maxBatchSize
+    self.maxWait = maxWait
+    self.queue = collections.deque()
+    self.cond = threading.Condition()
+    self.lock = threading.Lock()
+    self.batchSizes = collections.deque(maxlen=1000)
+    self.latencies = collections.deque(maxlen=1000) # in seconds, from submitting until the result is available
+    self.numRequests = 0
+    self.numBatches = 0
+    threading.Thread(target=self.run, daemon=True).start()
+
+  def submit(self, rows):
+    future = Future()
+    with self.cond:
+      self.queue.append((np.atleast_2d(np.asarray(rows, dtype=np.float32)), future, time.time()))
+      self.cond.notify()
+    return future
+
+  def run(self):
+    while True:
+      with self.cond:
+        while not self.queue:
+          self.cond.wait()
+        deadline = time.time() + self.maxWait
+        while sum(r.shape[0] for r, _, _ in self.queue) < self.maxBatchSize and time.time() < deadline:
+          self.cond.wait(max(deadline - time.time(), 0))
+        requests = []
+        size = 0
+        while self.queue and (not requests or size + self.queue[0][0].shape[0] <= self.maxBatchSize):
+          requests.append(self.queue.popleft())
+          size += requests[-1][0].shape[0]
+      try:
+        results = self.fn(np.concatenate([r for r, _, _ in requests]))
+        bounds = np.cumsum([0] + [r.shape[0] for r, _, _ in requests])
+        for i, (_, future, _) in enumerate(requests):
+          future.set_result(results[bounds[i]:bounds[i + 1]])
+      except Exception as e:
+        for _, future, _ in requests:
+          future.set_exception(e)
+      now = time.time()
+      with self.lock:
+        self.numBatches += 1
+        self.numRequests += len(requests)
+        self.batchSizes.append(len(requests))
+        self.latencies.extend(now - submitted for _, _, submitted in requests)
+
+  def stats(self):
+    with self.lock:
+      latencies = np.array(self.latencies)*1000.0
+      batchSizes = np.array(self.batchSizes)
+      ret = {"requests": self.numRequests, "batches": self.numBatches}
+    if latencies.size > 0: # over the last 1000 requests/batches
+      ret["latencyMs"] = {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95)), "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())}
+      ret["requestsPerBatch"] = {"mean": float(batchSizes.mean()), "max": int(batchSizes.max())}
+    return ret
+
+def loadNeuralModels():
+  models = {}
+  for name, filename in NEURAL_MODELS.items():
+    filename = os.path.join(dirname, filename)
+    if os.path.isfile(filename):
+      model = loadNumpyModel(filename)
+      models[name] = {"batcher": MicroBatcher(model.predict_on_batch), "dims": model.denseLayers[0][0].shape[0]}
+  return models
+
+def loadBayesianModels():
+  models = {}
+  for name, config in BAYESIAN_MODELS.items():
+    cacheDir = os.path.join(dirname, config["cache"])
+    keys = list_traces(cacheDir)
+    if not keys:
+      continue
+    trace = {var: np.array(values) for var, values in load_trace(cacheDir, keys[0]).items()} # keep it hot in memory
+    baseHazard = trace["lambda0"] if config["numSlices"] is None else trace["lambda0"]*np.ones(config["numSlices"])
+    predict = lambda rows, trace=trace, baseHazard=baseHazard: survival_function_means(trace["beta"], baseHazard, rows, INTERVAL_LENGTH)
+    attributes = load_trace_settings(cacheDir, keys[0]).get("attributes")
+    models[name] = {"batcher": MicroBatcher(predict), "attributes": attributes, "dims": trace["beta"].shape[1], "trace": keys[0]}
+  return models
+
+def featureRows(features, attributes): # attribute dicts are converted to vectors, missing attributes count as 0
+  if attributes is None:
+    return features
+  return [[float(f.get(a, 0)) for a in attributes] if isinstance(f, dict) else f for f in features]
+
+def makeHandler(neuralModels, bayesianModels):
+  kinds = {"neural": neuralModels, "bayesian": bayesianModels}
+
+  class Handler(BaseHTTPRequestHandler):
+    def sendJSON(self, code, obj):
+      body = json.dumps(obj).encode("utf-8")
+      self.send_response(code)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_GET(self):
+      if self.path == "/models":
+        self.sendJSON(200, {kind: {name: {k: v for k, v in m.items() if k != "batcher"} for name, m in models.items()} for kind, models in kinds.items()})
+      elif self.path == "/stats":
+        self.sendJSON(200, {kind: {name: m["batcher"].stats() for name, m in models.items()} for kind, models in kinds.items()})
+      else:
+        self.sendJSON(404, {"error": "unknown path"})
+
+    def do_POST(self):
+      start = time.time()
+      parts = self.path.strip("/").split("/")
+      if len(parts) != 2 or parts[0] not in kinds or parts[1] not in kinds[parts[0]]:
+        return self.sendJSON(404, {"error": "unknown model"})
+      model = kinds[parts[0]][parts[1]]
+      try:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        rows = np.atleast_2d(np.asarray(featureRows(request["features"], model.get("attributes")), dtype=np.float32))
+        if rows.shape[1] != model["dims"]:
+          raise ValueError("expected %d features per row, got %d" % (model["dims"], rows.shape[1]))
+      except (ValueError, KeyError, TypeError) as e:
+        return self.sendJSON(400, {"error": str(e)})
+      try:
+        results = model["batcher"].submit(rows).result()
+      except Exception as e: # raised by the model for the whole batch
+        return self.sendJSON(500, {"error": "%s: %s" % (type(e).__name__, e)})
+      key = "predictions" if parts[0] == "neural" else "survivalFunctionMean"
+      self.sendJSON(200, {key: results.tolist(), "latencyMs": (time.time() - start)*1000.0})
+
+    def log_message(self, format, *args): # don't log every single request
+      pass
+
+  return Handler
+
+class Server(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+  request_queue_size = 128 # many concurrent clients are the point of micro-batching
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Serve predictions for hypothetical characters from the trained models.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8765)
+  args = parser.parse_args()
+
+  neuralModels = loadNeuralModels()
+  bayesianModels = loadBayesianModels()
+  print("neural models: %s, Bayesian models: %s" % (", ".join(neuralModels) or "none", ", ".join(bayesianModels) or "none"))
+  print("listening on http://%s:%d" % (args.host, args.port))
+  Server((args.host, args.port), makeHandler(neuralModels, bayesianModels)).serve_forever()
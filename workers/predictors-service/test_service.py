@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import unittest
+import http.client
+import numpy as np
+
+from service import MicroBatcher, Server, makeHandler
+
+
+
+def failingPredict(rows):
+  raise RuntimeError("model failed")
+
+class ServiceTest(unittest.TestCase):
+  def setUp(self):
+    neuralModels = {
+      "double": {"batcher": MicroBatcher(lambda rows: rows*2), "dims": 2},
+      "failing": {"batcher": MicroBatcher(failingPredict), "dims": 2},
+    }
+    self.server = Server(("127.0.0.1", 0), makeHandler(neuralModels, {}))
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def post(self, path, obj):
+    connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+    try:
+      connection.request("POST", path, json.dumps(obj), {"Content-Type": "application/json"})
+      response = connection.getresponse()
+      return response.status, response.getheader("Content-Type"), json.loads(response.read().decode("utf-8"))
+    finally:
+      connection.close()
+
+  def test_predictions(self):
+    status, _, body = self.post("/neural/double", {"features": [[1, 2], [3, 4]]})
+    self.assertEqual(status, 200)
+    np.testing.assert_array_equal(body["predictions"], [[2, 4], [6, 8]])
+
+  def test_bad_request(self):
+    status, _, body = self.post("/neural/double", {"features": [[1, 2, 3]]})
+    self.assertEqual(status, 400)
+    self.assertIn("expected 2 features", body["error"])
+
+  def test_failing_model(self): # the exception of the model is answered with a 500, the server keeps serving
+    status, contentType, body = self.post("/neural/failing", {"features": [[1, 2]]})
+    self.assertEqual(status, 500)
+    self.assertEqual(contentType, "application/json")
+    self.assertEqual(body, {"error": "RuntimeError: model failed"})
+    status, _, _ = self.post("/neural/double", {"features": [[1, 2]]})
+    self.assertEqual(status, 200)
+
+
+
+if __name__ == "__main__":
+  unittest.main()